@@ -3,21 +3,38 @@ from pathlib import Path
 from loguru import logger
 
 
+# Формат записей без цветовой разметки (файлы и консоль без TTY)
+PLAIN_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}"
+
+# Формат с цветами для интерактивной консоли
+COLOR_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
+    "<level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
+    "<level>{message}</level>"
+)
+
+# Флаг повторного вызова setup_logging
+_configured = False
+
+
 def setup_logging():
-    """Настройка логирования для приложения"""
+    """Настройка логирования для приложения (повторные вызовы игнорируются)"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
     
     # Удаляем стандартный обработчик loguru
     logger.remove()
     
-    # Поток в консоль с цветами
+    # Поток в консоль: цвета только в терминале (под systemd/docker - простой формат)
+    is_tty = sys.stdout.isatty()
     logger.add(
         sys.stdout,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
-               "<level>{level: <8}</level> | "
-               "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - "
-               "<level>{message}</level>",
+        format=COLOR_FORMAT if is_tty else PLAIN_FORMAT,
         level="INFO",
-        colorize=True
+        colorize=is_tty
     )
     
     # Создаем папку для логов если не существует
@@ -27,27 +44,25 @@ def setup_logging():
     # Поток в файл с ротацией
     logger.add(
         "logs/bot.log",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+        format=PLAIN_FORMAT,
         level="DEBUG",
         rotation="10 MB",  # Ротация по размеру
         retention="7 days",  # Хранение 7 дней
         compression="zip",  # Сжатие старых логов
-        encoding="utf-8"
+        encoding="utf-8",
+        enqueue=True  # Запись на диск в фоновом потоке
     )
     
     # Отдельный файл для ошибок
     logger.add(
         "logs/errors.log",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+        format=PLAIN_FORMAT,
         level="ERROR",
         rotation="5 MB",
         retention="14 days",  # Ошибки храним дольше
         compression="zip",
-        encoding="utf-8"
+        encoding="utf-8",
+        enqueue=True
     )
     
     logger.info("Логирование настроено успешно")
-
-
-# Настраиваем логирование при импорте модуля
-setup_logging()
\ No newline at end of file
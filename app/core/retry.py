@@ -1,92 +1,129 @@
 # Механизмы повторных попыток
 
+import asyncio
+import inspect
+import time
 from functools import wraps
-from typing import Any, Callable, TypeVar
+from typing import Any, Callable, Tuple, Type, TypeVar
 from tenacity import (
-    retry,
+    AsyncRetrying,
+    Retrying,
     stop_after_attempt,
     wait_fixed,
-    retry_if_exception_type,
-    before_sleep_log,
-    after_log
+    retry_if_exception_type
 )
 from loguru import logger
 import httpx
 
 F = TypeVar('F', bound=Callable[..., Any])
 
+# Максимум 2 попытки, пауза перед повтором 3с
+RETRY_ATTEMPTS = 2
+RETRY_DELAY = 3
 
-def retry_on_network_error(func: F) -> F:
-    """
-    Декоратор для повторных попыток при сетевых ошибках
-    Максимум 2 попытки с задержкой 1с, затем 3с
-    """
-    @retry(
-        stop=stop_after_attempt(2),
-        wait=wait_fixed(1) + wait_fixed(2),  # 1с + 2с = 3с на вторую попытку
-        retry=retry_if_exception_type((
-            httpx.RequestError,
-            httpx.TimeoutException,
-            ConnectionError,
-            TimeoutError
-        )),
-        before_sleep=before_sleep_log(logger, "WARNING"),
-        after=after_log(logger, "INFO")
-    )
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    
-    return wrapper
-
-
-def retry_on_llm_error(func: F) -> F:
-    """
-    Декоратор для повторных попыток при ошибках LLM
-    Максимум 2 попытки с задержкой 1с, затем 3с
-    """
-    @retry(
-        stop=stop_after_attempt(2),
-        wait=wait_fixed(1) + wait_fixed(2),  # 1с + 2с = 3с на вторую попытку
-        retry=retry_if_exception_type((
-            Exception,  # Ловим общие ошибки API
-        )),
-        before_sleep=before_sleep_log(logger, "WARNING"),
-        after=after_log(logger, "INFO")
-    )
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    
-    return wrapper
-
-
-def retry_on_api_error(func: F) -> F:
+# Сетевые ошибки, при которых имеет смысл повторить запрос
+NETWORK_ERRORS = (
+    httpx.RequestError,
+    httpx.TimeoutException,
+    ConnectionError,
+    TimeoutError
+)
+
+
+def _make_retry(
+    exc_types: Tuple[Type[BaseException], ...],
+    log_exc: bool = False,
+    log_calls: bool = False
+) -> Callable[[F], F]:
     """
-    Универсальный декоратор для API вызовов
-    Максимум 2 попытки с задержкой 1с, затем 3с
+    Построение декоратора повторных попыток
+
+    Первая попытка выполняется напрямую, без tenacity: в подавляющем
+    большинстве вызовов она успешна. Только после ошибки управление
+    передается tenacity на оставшиеся попытки (пауза перед ними и запись
+    в лог - в обертке, tenacity только повторяет). Корутинные функции
+    оборачиваются в async wrapper (иначе ошибка возникла бы уже в
+    вызывающем коде и повтора бы не было), обычные - в синхронный.
+
+    Args:
+        exc_types: Типы исключений, при которых делается повтор
+        log_exc: Логировать traceback первой ошибки перед повтором
+        log_calls: Логировать успешные и неудачные вызовы
     """
-    @retry(
-        stop=stop_after_attempt(2),
-        wait=wait_fixed(1) + wait_fixed(2),  # 1с + 2с = 3с на вторую попытку
-        retry=retry_if_exception_type((
-            httpx.RequestError,
-            httpx.TimeoutException,
-            ConnectionError,
-            TimeoutError,
-            Exception
-        )),
-        before_sleep=before_sleep_log(logger, "WARNING", exc_info=True),
-        after=after_log(logger, "INFO")
-    )
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        try:
-            result = func(*args, **kwargs)
-            logger.debug(f"Успешный вызов {func.__name__}")
-            return result
-        except Exception as e:
-            logger.error(f"Ошибка в {func.__name__}: {e}")
-            raise
-    
-    return wrapper
\ No newline at end of file
+    def decorator(func: F) -> F:
+        retry_kwargs = dict(
+            stop=stop_after_attempt(RETRY_ATTEMPTS - 1),
+            wait=wait_fixed(RETRY_DELAY),
+            retry=retry_if_exception_type(exc_types),
+            reraise=True
+        )
+
+        if inspect.iscoroutinefunction(func):
+            retrying = AsyncRetrying(**retry_kwargs)
+
+            async def _call_async(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except exc_types as e:
+                    logger.opt(exception=log_exc).warning(
+                        f"Ошибка в {func.__name__}: {e}. Повтор через {RETRY_DELAY}с"
+                    )
+
+                await asyncio.sleep(RETRY_DELAY)
+                return await retrying(func, *args, **kwargs)
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not log_calls:
+                    return await _call_async(*args, **kwargs)
+
+                try:
+                    result = await _call_async(*args, **kwargs)
+                    logger.debug(f"Успешный вызов {func.__name__}")
+                    return result
+                except Exception as e:
+                    logger.error(f"Ошибка в {func.__name__}: {e}")
+                    raise
+
+            return wrapper
+
+        # Синхронная функция - тот же сценарий без event loop
+        retrying = Retrying(**retry_kwargs)
+
+        def _call_sync(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except exc_types as e:
+                logger.opt(exception=log_exc).warning(
+                    f"Ошибка в {func.__name__}: {e}. Повтор через {RETRY_DELAY}с"
+                )
+
+            time.sleep(RETRY_DELAY)
+            return retrying(func, *args, **kwargs)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not log_calls:
+                return _call_sync(*args, **kwargs)
+
+            try:
+                result = _call_sync(*args, **kwargs)
+                logger.debug(f"Успешный вызов {func.__name__}")
+                return result
+            except Exception as e:
+                logger.error(f"Ошибка в {func.__name__}: {e}")
+                raise
+
+        return wrapper
+
+    return decorator
+
+
+# Декоратор для повторных попыток при сетевых ошибках
+retry_on_network_error = _make_retry(NETWORK_ERRORS)
+
+# Декоратор для повторных попыток при ошибках LLM (ловим общие ошибки API)
+retry_on_llm_error = _make_retry((Exception,))
+
+# Универсальный декоратор для API вызовов
+retry_on_api_error = _make_retry(NETWORK_ERRORS + (Exception,), log_exc=True, log_calls=True)
@@ -1,4 +1,5 @@
-from typing import List
+from functools import cached_property
+from typing import FrozenSet, List
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -28,6 +29,10 @@ class Settings(BaseSettings):
         default=10,
         description="Лимит запросов по умолчанию для пользователя"
     )
+    max_concurrent_audits: int = Field(
+        default=8,
+        description="Максимум одновременных загрузок и анализов сайтов"
+    )
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -35,15 +40,20 @@ class Settings(BaseSettings):
         case_sensitive=False
     )
 
+    @cached_property
+    def admin_ids(self) -> FrozenSet[int]:
+        """Множество ID администраторов (разбирается один раз)"""
+        if not self.admin_user_ids.strip():
+            return frozenset()
+        return frozenset(int(x.strip()) for x in self.admin_user_ids.split(',') if x.strip())
+
     def get_admin_ids(self) -> List[int]:
         """Получение списка ID администраторов"""
-        if not self.admin_user_ids.strip():
-            return []
-        return [int(x.strip()) for x in self.admin_user_ids.split(',') if x.strip()]
+        return list(self.admin_ids)
 
     def is_admin(self, user_id: int) -> bool:
         """Проверка является ли пользователь администратором"""
-        return user_id in self.get_admin_ids()
+        return user_id in self.admin_ids
 
 
 # Глобальный экземпляр настроек
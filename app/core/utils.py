@@ -1,13 +1,37 @@
 # Вспомогательные утилиты
 import re
+from functools import lru_cache
+from typing import Optional
 from urllib.parse import urlparse, urlunparse
 from loguru import logger
 
+# URL, который уже в каноническом виде: https, домен в нижнем регистре без www.,
+# без порта, без завершающего слеша в пути и без пустых query/fragment
+_CANONICAL_URL_RE = re.compile(
+    r'https://(?!www\.)[a-z0-9.-]+(?:/[^?#;\s]*[^/?#;\s])?(?:\?[^#\s]+)?(?:#\S+)?'
+)
+
+# Символы, при которых URL разбирается через urlparse
+# (IPv6, параметры пути, управляющие символы, пробелы)
+_URL_SLOW_PATH_RE = re.compile(r'[\[\];\s\x00-\x1f\x7f]')
+
+# Предкомпилированные паттерны для clean_text
+_WS_RE = re.compile(r'\s+')
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s\-.,!?@#$%&*()+=<>:;/\\|{}[\]~`]')
+
+# ASCII-символы, которые удаляет _SPECIAL_CHARS_RE (для быстрого пути через bytes.translate)
+_SPECIAL_ASCII_BYTES = bytes(c for c in range(128) if _SPECIAL_CHARS_RE.match(chr(c)))
+
 
 def normalize_url(s: str) -> str:
     """
     Нормализация URL с поддержкой различных форматов
     
+    Результаты для строк кэшируются (lru_cache в _normalize_url_cached):
+    функция чистая и вызывается повторно для одних и тех же адресов.
+    Проверка типа стоит до кэша, поэтому для не-строк (в том числе
+    нехэшируемых) возвращается пустая строка, а не TypeError.
+    
     Args:
         s: URL строка для нормализации
         
@@ -23,6 +47,16 @@ def normalize_url(s: str) -> str:
     if not s or not isinstance(s, str):
         return ""
     
+    return _normalize_url_cached(s)
+
+
+@lru_cache(maxsize=4096)
+def _normalize_url_cached(s: str) -> str:
+    """Нормализация непустой строки URL (см. normalize_url)"""
+    # Быстрый путь: URL уже нормализован
+    if _CANONICAL_URL_RE.fullmatch(s):
+        return s
+    
     # Убираем пробелы
     url = s.strip()
     
@@ -33,6 +67,12 @@ def normalize_url(s: str) -> str:
     if not url.startswith(('http://', 'https://')):
         url = 'https://' + url
     
+    # Обычный ASCII URL разбираем вручную за один проход
+    if url.isascii() and not _URL_SLOW_PATH_RE.search(url):
+        normalized = _fast_normalize(url)
+        if normalized:
+            return normalized
+    
     try:
         # Парсим URL
         parsed = urlparse(url)
@@ -60,7 +100,6 @@ def normalize_url(s: str) -> str:
             parsed.fragment
         ))
         
-        logger.debug(f"URL нормализован: {s} -> {normalized}")
         return normalized
         
     except Exception as e:
@@ -68,6 +107,54 @@ def normalize_url(s: str) -> str:
         return ""
 
 
+def _fast_normalize(url: str) -> Optional[str]:
+    """
+    Однопроходная нормализация ASCII URL со схемой http(s)://
+    
+    Дает тот же результат, что и urlparse/urlunparse в normalize_url,
+    но без построения ParseResult. Возвращает None для пустого домена -
+    такие URL разбираются через urlparse.
+    """
+    # Разбиваем на части: домен / путь ? query # fragment
+    netloc_start = url.index('://') + 3
+    
+    fragment = ''
+    hash_pos = url.find('#', netloc_start)
+    if hash_pos != -1:
+        fragment = url[hash_pos + 1:]
+        url = url[:hash_pos]
+    
+    query = ''
+    query_pos = url.find('?', netloc_start)
+    if query_pos != -1:
+        query = url[query_pos + 1:]
+        url = url[:query_pos]
+    
+    path_pos = url.find('/', netloc_start)
+    if path_pos == -1:
+        netloc, path = url[netloc_start:], ''
+    else:
+        netloc, path = url[netloc_start:path_pos], url[path_pos:]
+    
+    # Домен в нижнем регистре и без www.
+    netloc = netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    if not netloc:
+        return None
+    
+    # Убираем trailing slash если нет пути
+    if path == '/':
+        path = ''
+    
+    parts = ['https://', netloc, path]
+    if query:
+        parts += ('?', query)
+    if fragment:
+        parts += ('#', fragment)
+    return ''.join(parts)
+
+
 def is_valid_url(url: str) -> bool:
     """
     Проверка валидности URL
@@ -78,9 +165,16 @@ def is_valid_url(url: str) -> bool:
     Returns:
         True если URL валидный
     """
-    if not url:
+    # Проверка типа до кэша: нехэшируемый аргумент не должен давать TypeError
+    if not url or not isinstance(url, str):
         return False
-        
+    
+    return _is_valid_url_cached(url)
+
+
+@lru_cache(maxsize=4096)
+def _is_valid_url_cached(url: str) -> bool:
+    """Проверка валидности строки URL (см. is_valid_url)"""
     try:
         parsed = urlparse(url)
         return bool(parsed.scheme and parsed.netloc)
@@ -98,6 +192,16 @@ def extract_domain(url: str) -> str:
     Returns:
         Доменное имя или пустая строка
     """
+    # Проверка типа до кэша: нехэшируемый аргумент не должен давать TypeError
+    if not isinstance(url, str):
+        return ""
+    
+    return _extract_domain_cached(url)
+
+
+@lru_cache(maxsize=4096)
+def _extract_domain_cached(url: str) -> str:
+    """Извлечение домена из строки URL (см. extract_domain)"""
     try:
         parsed = urlparse(url)
         domain = parsed.netloc.lower()
@@ -126,9 +230,37 @@ def clean_text(text: str) -> str:
         return ""
     
     # Убираем лишние пробелы и переносы строк
-    cleaned = re.sub(r'\s+', ' ', text.strip())
+    cleaned = _WS_RE.sub(' ', text.strip())
     
     # Убираем специальные символы которые могут мешать
-    cleaned = re.sub(r'[^\w\s\-.,!?@#$%&*()+=<>:;/\\|{}[\]~`]', '', cleaned)
+    if cleaned.isascii():
+        # Быстрый путь: удаление байтов на уровне C без regex-движка
+        cleaned = cleaned.encode('ascii').translate(None, _SPECIAL_ASCII_BYTES).decode('ascii')
+    else:
+        cleaned = _SPECIAL_CHARS_RE.sub('', cleaned)
+    
+    return cleaned
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    Извлечение JSON объекта из текста (от первой '{' до последней '}')
+    
+    Args:
+        text: Текст, содержащий JSON объект
+        
+    Returns:
+        Подстрока с JSON объектом или None если скобок нет
+    """
+    if not text:
+        return None
+    
+    start = text.find('{')
+    if start == -1:
+        return None
+    
+    end = text.rfind('}')
+    if end < start:
+        return None
     
-    return cleaned
\ No newline at end of file
+    return text[start:end + 1]
\ No newline at end of file
@@ -1,8 +1,53 @@
 import re
-from bs4 import BeautifulSoup
-from bs4 import Comment
+from collections import Counter
+from typing import Optional
+from selectolax.lexbor import LexborHTMLParser
 from loguru import logger
 
+# Служебные теги, которые не несут видимого текста
+SERVICE_TAGS = ["script", "style", "noscript", "meta", "link", "head"]
+
+# Максимальный объем HTML для запасной очистки регулярными выражениями
+FALLBACK_MAX_LEN = 500_000
+
+# Предкомпилированные регулярные выражения
+_WS_RE = re.compile(r'\s+')
+_NL_RE = re.compile(r'\n+')
+_TAG_RE = re.compile(r'<[^>]+>')
+_DISPLAY_NONE_RE = re.compile(r'display\s*:\s*none', re.I)
+_HIDDEN_RE = re.compile(r'hidden', re.I)
+
+# Паттерны навигационных элементов для удаления
+NOISE_PATTERNS = (
+    r'главная\s+о\s+нас\s+услуги\s+контакты',
+    r'home\s+about\s+services\s+contact',
+    r'меню\s+\|',
+    r'©\s*\d{4}.*?права защищены',
+    r'cookie.*?согласие',
+    r'политика конфиденциальности',
+    r'пользовательское соглашение',
+)
+
+# Паттерны применяются по очереди, а не одной альтернацией: при пересечении
+# совпадений (например, "cookie ... © 2020 ... согласие ... права защищены")
+# альтернация удаляет другой фрагмент, что меняет текст для LLM и ключ кэша
+_NOISE_RES = [re.compile(pattern, re.I) for pattern in NOISE_PATTERNS]
+
+
+def _parse_html(html: str) -> Optional[LexborHTMLParser]:
+    """Разбор HTML; None если парсер не справился"""
+    try:
+        return LexborHTMLParser(html)
+    except Exception as e:
+        logger.error(f"Ошибка разбора HTML: {e}")
+        return None
+
+
+def _strip_tags_fallback(html: str) -> str:
+    """Простая очистка без парсера (вход ограничен FALLBACK_MAX_LEN символами)"""
+    text = _TAG_RE.sub('', html[:FALLBACK_MAX_LEN])
+    return _WS_RE.sub(' ', text).strip()
+
 
 def clean_html(html: str) -> str:
     """
@@ -14,48 +59,60 @@ def clean_html(html: str) -> str:
     Returns:
         Очищенный текст без лишних пробелов и служебных элементов
     """
+    if not html or not html.strip():
+        return ""
+    
+    # Быстрый путь: в ответе нет тегов — парсер не нужен
+    if '<' not in html:
+        return _WS_RE.sub(' ', html).strip()
+    
+    # Парсим HTML (lexbor, C-бэкенд)
+    tree = _parse_html(html)
+    if tree is None:
+        return _strip_tags_fallback(html)
+    
     try:
-        if not html or not html.strip():
-            return ""
-        
-        # Создаем BeautifulSoup объект
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Удаляем ненужные теги
-        for tag in soup(["script", "style", "noscript", "meta", "link", "head"]):
-            tag.decompose()
-        
-        # Удаляем комментарии (исправленная версия)
-        for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-            comment.extract()
-        
-        # Извлекаем текст
-        text = soup.get_text()
-        
-        # Нормализуем пробелы и переносы строк
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\n+', '\n', text)
-        
-        # Убираем лишние пробелы в начале и конце строк
-        lines = [line.strip() for line in text.split('\n')]
-        text = '\n'.join(line for line in lines if line)
-        
-        # Общая очистка
-        text = text.strip()
-        
-        logger.debug(f"HTML очищен: {len(html)} символов -> {len(text)} символов")
-        return text
-        
+        text = clean_tree(tree)
     except Exception as e:
         logger.error(f"Ошибка очистки HTML: {e}")
-        # Возвращаем исходный текст в случае ошибки, но без тегов
-        try:
-            # Простая очистка без BeautifulSoup
-            text = re.sub(r'<[^>]+>', '', html)
-            text = re.sub(r'\s+', ' ', text)
-            return text.strip()
-        except:
-            return html[:1000]  # В крайнем случае возвращаем первые 1000 символов
+        # Возвращаем исходный текст без тегов
+        return _strip_tags_fallback(html)
+    
+    logger.debug("HTML очищен: {} символов -> {} символов", len(html), len(text))
+    return text
+
+
+def clean_tree(tree: LexborHTMLParser) -> str:
+    """
+    Преобразование уже разобранного HTML в нормализованный текст
+    
+    Позволяет разобрать страницу один раз и использовать дерево и для
+    поиска ссылок, и для извлечения текста. Дерево изменяется на месте:
+    служебные теги удаляются.
+    
+    Args:
+        tree: Разобранный HTML документ
+        
+    Returns:
+        Очищенный текст без лишних пробелов и служебных элементов
+    """
+    # Удаляем ненужные теги (комментарии lexbor в текст не включает)
+    tree.strip_tags(SERVICE_TAGS)
+    
+    # Извлекаем текст
+    root = tree.body or tree.root
+    text = root.text(separator=' ') if root else ""
+    
+    # Нормализуем пробелы и переносы строк
+    text = _WS_RE.sub(' ', text)
+    text = _NL_RE.sub('\n', text)
+    
+    # Убираем лишние пробелы в начале и конце строк
+    lines = [line.strip() for line in text.split('\n')]
+    text = '\n'.join(line for line in lines if line)
+    
+    # Общая очистка
+    return text.strip()
 
 
 def extract_visible_text(html: str) -> str:
@@ -68,32 +125,41 @@ def extract_visible_text(html: str) -> str:
     Returns:
         Видимый текст без скрытых элементов
     """
+    if not html:
+        return ""
+    
+    # Разбираем один раз: при ошибке сразу переходим к простой очистке,
+    # не пытаясь повторно разобрать тот же HTML
+    tree = _parse_html(html)
+    if tree is None:
+        return _strip_tags_fallback(html)
+    
     try:
-        soup = BeautifulSoup(html, 'html.parser')
-        
         # Удаляем скрытые элементы
-        for tag in soup.find_all(attrs={"style": re.compile(r"display\s*:\s*none", re.I)}):
-            tag.decompose()
+        for node in tree.css('[style]'):
+            if _DISPLAY_NONE_RE.search(node.attrs.get('style') or ''):
+                node.decompose()
         
-        for tag in soup.find_all(attrs={"class": re.compile(r"hidden", re.I)}):
-            tag.decompose()
+        for node in tree.css('[class]'):
+            if _HIDDEN_RE.search(node.attrs.get('class') or ''):
+                node.decompose()
             
         # Удаляем служебные теги
-        for tag in soup(["script", "style", "noscript", "meta", "link", "head", "nav", "footer"]):
-            tag.decompose()
+        tree.strip_tags(SERVICE_TAGS + ["nav", "footer"])
         
         # Извлекаем весь видимый текст (убрано приоритизирование main)
-        text = soup.get_text()
+        root = tree.body or tree.root
+        text = root.text(separator=' ') if root else ""
         
         # Очистка
-        text = re.sub(r'\s+', ' ', text)
+        text = _WS_RE.sub(' ', text)
         text = text.strip()
         
         return text
         
     except Exception as e:
         logger.error(f"Ошибка извлечения видимого текста: {e}")
-        return clean_html(html)
+        return _strip_tags_fallback(html)
 
 
 def remove_navigation_noise(text: str) -> str:
@@ -107,35 +173,19 @@ def remove_navigation_noise(text: str) -> str:
         Текст без навигационных элементов
     """
     try:
-        # Паттерны для удаления навигационных элементов
-        noise_patterns = [
-            r'главная\s+о\s+нас\s+услуги\s+контакты',
-            r'home\s+about\s+services\s+contact',
-            r'меню\s+\|',
-            r'©\s*\d{4}.*?права защищены',
-            r'cookie.*?согласие',
-            r'политика конфиденциальности',
-            r'пользовательское соглашение',
-        ]
-        
-        for pattern in noise_patterns:
-            text = re.sub(pattern, '', text, flags=re.IGNORECASE)
+        for pattern in _NOISE_RES:
+            text = pattern.sub('', text)
         
         # Удаляем повторяющиеся фразы (больше 3 раз)
         words = text.split()
         if len(words) > 10:
-            word_counts = {}
-            for word in words:
-                if len(word) > 3:  # Только длинные слова
-                    word_counts[word.lower()] = word_counts.get(word.lower(), 0) + 1
+            lowered = [word.lower() for word in words]
+            word_counts = Counter(word for word in lowered if len(word) > 3)  # Только длинные слова
             
             # Удаляем слова которые повторяются слишком часто
-            filtered_words = []
-            for word in words:
-                if word_counts.get(word.lower(), 0) <= 3:
-                    filtered_words.append(word)
-            
-            text = ' '.join(filtered_words)
+            text = ' '.join(
+                word for word, lower in zip(words, lowered) if word_counts[lower] <= 3
+            )
         
         return text.strip()
         
@@ -1,17 +1,98 @@
+import asyncio
 import httpx
+import orjson
 import re
 from typing import Optional, Dict, List
 from urllib.parse import urljoin, urlparse
+from selectolax.lexbor import LexborHTMLParser
 from loguru import logger
 
-from app.core.utils import normalize_url
+from app.core.utils import normalize_url, extract_json_object
 from app.core.retry import retry_on_network_error, retry_on_api_error
 from app.core.settings import settings
-from app.features.audit.adapters.cleaner import clean_html
+from app.features.audit.adapters.cleaner import clean_html, clean_tree
 
 # Флаг для контроля использования web tools (синхронизирован с llm.py)
 USE_WEB_TOOLS = False  # По умолчанию отключен для стабильности
 
+# Ключевые слова для поиска ценовых страниц
+PRICING_KEYWORDS = [
+    "цены", "цена", "тариф", "тарифы", "стоимость", "прайс",
+    "pricing", "price", "prices", "tariff", "cost", "payment", "план"
+]
+
+# Все ключевые слова одним паттерном (длинные первыми, чтобы в лог шло полное слово)
+_PRICING_RE = re.compile(
+    '|'.join(map(re.escape, sorted(PRICING_KEYWORDS, key=len, reverse=True))),
+    re.IGNORECASE
+)
+
+# Приоритет ключевых слов (меньше - надежнее указывает на страницу цен),
+# слова не из таблицы получают самый низкий приоритет
+_PRICING_PRIORITY = {
+    "цены": 0, "цена": 0, "прайс": 0, "pricing": 0, "price": 0, "prices": 0,
+    "тариф": 1, "тарифы": 1, "tariff": 1,
+    "стоимость": 2, "cost": 2,
+}
+_LOWEST_PRIORITY = 3
+
+# Максимальный размер загружаемой страницы
+MAX_RESPONSE_BYTES = 3 * 1024 * 1024
+
+# Типы содержимого, которые имеет смысл загружать
+HTML_CONTENT_TYPES = ('text/', 'application/xhtml+xml')
+
+# Порог текста главной, ниже которого подозреваем рендеринг на JS
+MIN_STATIC_TEXT_LEN = 500
+
+# Признаки SPA, контент которых собирается в браузере
+_SPA_MARKERS_RE = re.compile(
+    r'<div id="(?:root|app|__next)">\s*</div>|__NEXT_DATA__|window\.__NUXT__'
+)
+
+# Сколько ссылок-кандидатов на цены загружать параллельно
+PRICING_CANDIDATES = 3
+
+
+# Сколько секунд держать простаивающее соединение открытым: главная,
+# страницы цен и повторные анализы того же сайта идут в пределах этого окна
+KEEPALIVE_EXPIRY = 30.0
+
+# Общий HTTP клиент: переиспользует соединения между загрузками
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Получение общего httpx клиента (создается при первом обращении)"""
+    global _http_client
+    
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=15.0,
+            headers={
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+            },
+            limits=httpx.Limits(
+                max_keepalive_connections=50,
+                max_connections=100,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            ),
+            follow_redirects=True
+        )
+        logger.debug("HTTP клиент создан")
+    
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Закрытие общего httpx клиента (при остановке бота)"""
+    global _http_client
+    
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.debug("HTTP клиент закрыт")
+
 
 @retry_on_network_error
 async def http_fetch(url: str) -> str:
@@ -25,16 +106,29 @@ async def http_fetch(url: str) -> str:
         HTML содержимое страницы
     """
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            
-            response = await client.get(url, headers=headers, follow_redirects=True)
+        client = get_http_client()
+        
+        async with client.stream('GET', url) as response:
             response.raise_for_status()
             
-            logger.debug(f"HTTP загрузка {url}: {response.status_code}, {len(response.text)} символов")
-            return response.text
+            # Не тратим трафик и память на не-HTML ответы (картинки, архивы и т.п.)
+            content_type = response.headers.get('content-type', '').lower()
+            if content_type and not content_type.startswith(HTML_CONTENT_TYPES):
+                raise ValueError(f"Неподдерживаемый тип содержимого: {content_type}")
+            
+            # Читаем тело по частям и обрываем загрузку на лимите
+            body = bytearray()
+            async for chunk in response.aiter_bytes(65536):
+                body.extend(chunk)
+                if len(body) >= MAX_RESPONSE_BYTES:
+                    logger.warning(f"Ответ {url} обрезан до {MAX_RESPONSE_BYTES} байт")
+                    del body[MAX_RESPONSE_BYTES:]
+                    break
+            
+            text = body.decode(response.encoding or 'utf-8', errors='replace')
+        
+        logger.debug("HTTP загрузка {}: {}, {} символов", url, response.status_code, len(text))
+        return text
             
     except Exception as e:
         logger.error(f"Ошибка HTTP загрузки {url}: {e}")
@@ -45,6 +139,10 @@ def find_pricing_link(home_html: str, base_url: str) -> Optional[str]:
     """
     Поиск ссылки на страницу с ценами
     
+    Возвращается лучший кандидат find_pricing_links_in_tree: ссылка с более
+    точным ключевым словом ("цены", "pricing") побеждает менее точную
+    ("стоимость", "оплата"), даже если та стоит на странице раньше.
+    
     Args:
         home_html: HTML содержимое главной страницы
         base_url: Базовый URL для формирования абсолютных ссылок
@@ -53,46 +151,114 @@ def find_pricing_link(home_html: str, base_url: str) -> Optional[str]:
         Абсолютный URL страницы с ценами или None
     """
     try:
-        # Ключевые слова для поиска ценовых страниц
-        pricing_keywords = [
-            "цены", "цена", "тариф", "тарифы", "стоимость", "прайс",
-            "pricing", "price", "prices", "tariff", "cost", "payment", "план"
-        ]
+        if not home_html:
+            return None
         
-        # Паттерн для поиска ссылок
-        link_pattern = r'<a[^>]*href=["\']([^"\']+)["\'][^>]*>([^<]*)</a>'
-        
-        matches = re.findall(link_pattern, home_html, re.IGNORECASE | re.DOTALL)
-        
-        for href, link_text in matches:
-            # Проверяем текст ссылки и href на наличие ключевых слов
-            combined_text = f"{href} {link_text}".lower()
-            
-            for keyword in pricing_keywords:
-                if keyword in combined_text:
-                    # Формируем абсолютный URL
-                    absolute_url = urljoin(base_url, href)
-                    
-                    # Проверяем что это не якорная ссылка и не внешний сайт
-                    parsed_base = urlparse(base_url)
-                    parsed_link = urlparse(absolute_url)
-                    
-                    if (parsed_link.netloc == parsed_base.netloc and 
-                        not href.startswith('#') and 
-                        not href.startswith('mailto:') and
-                        not href.startswith('tel:')):
-                        
-                        logger.info(f"Найдена ссылка на цены: {absolute_url} (ключевое слово: {keyword})")
-                        return absolute_url
-        
-        logger.debug(f"Ссылка на цены не найдена на {base_url}")
-        return None
+        return find_pricing_link_in_tree(LexborHTMLParser(home_html), base_url)
         
     except Exception as e:
         logger.error(f"Ошибка поиска ссылки на цены: {e}")
         return None
 
 
+def find_pricing_link_in_tree(tree: LexborHTMLParser, base_url: str) -> Optional[str]:
+    """
+    Поиск ссылки на страницу с ценами в уже разобранном HTML
+    
+    Выбирается ссылка с наивысшим приоритетом ключевого слова, а не первая
+    по порядку на странице (см. find_pricing_links_in_tree).
+    
+    Args:
+        tree: Разобранный HTML главной страницы
+        base_url: Базовый URL для формирования абсолютных ссылок
+        
+    Returns:
+        Абсолютный URL страницы с ценами или None
+    """
+    links = find_pricing_links_in_tree(tree, base_url, limit=1)
+    return links[0] if links else None
+
+
+def find_pricing_links_in_tree(
+    tree: LexborHTMLParser,
+    base_url: str,
+    limit: int = PRICING_CANDIDATES
+) -> List[str]:
+    """
+    Поиск нескольких кандидатов на страницу с ценами
+    
+    Кандидаты упорядочены по приоритету ключевого слова ("цены", "pricing"
+    надежнее, чем "cost" или "план"), при равном приоритете - по порядку
+    появления на странице.
+    
+    Args:
+        tree: Разобранный HTML главной страницы
+        base_url: Базовый URL для формирования абсолютных ссылок
+        limit: Максимальное количество кандидатов
+        
+    Returns:
+        Список уникальных абсолютных URL внутри сайта
+    """
+    base_netloc = None
+    # URL -> приоритет; dict сохраняет порядок появления и убирает дубли
+    found: Dict[str, int] = {}
+    best_count = 0
+    
+    # Обходим ссылки по одной; досрочно выходим, набрав limit лучших кандидатов
+    for anchor in tree.css('a[href]'):
+        # attrs читает атрибут напрямую, без сборки dict всех атрибутов
+        href = (anchor.attrs.get('href') or '').strip()
+        
+        # Пропускаем якорные ссылки, почту и телефоны
+        if not href or href.startswith(('#', 'mailto:', 'tel:')):
+            continue
+        
+        # Проверяем href и текст ссылки на наличие ключевых слов
+        match = _PRICING_RE.search(href) or _PRICING_RE.search(anchor.text())
+        if not match:
+            continue
+        
+        # Формируем абсолютный URL
+        absolute_url = urljoin(base_url, href)
+        if absolute_url in found:
+            continue
+        
+        # Путь от корня сайта всегда ведет на тот же домен - urlparse не нужен
+        if href.startswith('/') and not href.startswith('//'):
+            is_internal = True
+        else:
+            if base_netloc is None:
+                base_netloc = urlparse(base_url).netloc
+            is_internal = urlparse(absolute_url).netloc == base_netloc
+        
+        # Проверяем что это не внешний сайт
+        if is_internal:
+            keyword = match.group(0).lower()
+            logger.info("Найдена ссылка на цены: {} (ключевое слово: {})", absolute_url, keyword)
+            priority = _PRICING_PRIORITY.get(keyword, _LOWEST_PRIORITY)
+            found[absolute_url] = priority
+            if priority == 0:
+                best_count += 1
+                if best_count >= limit:
+                    break
+    
+    if not found:
+        logger.debug("Ссылка на цены не найдена на {}", base_url)
+    
+    # Сортировка устойчивая: при равном приоритете сохраняется порядок на странице
+    return sorted(found, key=found.__getitem__)[:limit]
+
+
+async def _cancel_tasks(tasks: List[asyncio.Task]) -> None:
+    """Отмена незавершенных загрузок (ошибки уже завершенных не логируются)"""
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+    # gather забирает и результаты уже завершенных задач, чтобы их
+    # исключения не попадали в "Task exception was never retrieved"
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
 async def get_content_bundle(url: str) -> Dict[str, any]:
     """
     Получение полного контента сайта (главная + цены)
@@ -109,7 +275,7 @@ async def get_content_bundle(url: str) -> Dict[str, any]:
         if not normalized_url:
             raise ValueError(f"Не удалось нормализовать URL: {url}")
         
-        logger.info(f"Начинаем загрузку контента для {normalized_url}")
+        logger.info("Начинаем загрузку контента для {}", normalized_url)
         
         # Проверяем флаг USE_WEB_TOOLS
         if USE_WEB_TOOLS:
@@ -134,12 +300,10 @@ async def get_content_bundle(url: str) -> Dict[str, any]:
                 result_text = await run_with_tools(messages)
                 
                 # Пытаемся извлечь JSON из ответа
-                import json
-                import re
-                json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-                if json_match:
-                    result_data = json.loads(json_match.group(0))
-                    logger.info(f"Web tools успешно загрузили контент для {normalized_url}")
+                json_text = extract_json_object(result_text)
+                if json_text:
+                    result_data = orjson.loads(json_text)
+                    logger.info("Web tools успешно загрузили контент для {}", normalized_url)
                     return result_data
                 else:
                     # Если JSON не найден, fallback на простой ответ
@@ -152,42 +316,62 @@ async def get_content_bundle(url: str) -> Dict[str, any]:
             logger.info("Web tools отключены, используем HTTP fallback")
         
         # HTTP fallback - надежный метод
-        logger.info(f"Загружаем контент через HTTP для {normalized_url}")
+        logger.info("Загружаем контент через HTTP для {}", normalized_url)
         
         # Загружаем главную страницу
         home_html = await http_fetch(normalized_url)
-        home_text = clean_html(home_html)
         
-        if not home_text or len(home_text.strip()) < 50:
-            logger.error(f"Получен пустой или слишком короткий контент с {normalized_url}")
-            return {"home_text": "", "requires_js": True}
+        # Разбираем главную один раз: дерево нужно и для поиска ссылки на цены,
+        # и для извлечения текста (разбор - CPU-работа, выносим из event loop)
+        home_tree = await asyncio.to_thread(LexborHTMLParser, home_html)
         
-        result = {
-            "home_text": home_text,
-            "requires_js": len(home_text.strip()) < 500  # Подозреваем JS если текста мало
-        }
+        # Ищем кандидатов на страницу с ценами и сразу запускаем их загрузку,
+        # чтобы она шла параллельно (и параллельно с очисткой главной)
+        pricing_urls = find_pricing_links_in_tree(home_tree, normalized_url)
+        pricing_tasks = [asyncio.create_task(http_fetch(u)) for u in pricing_urls]
         
-        # Ищем и загружаем страницу с ценами
-        pricing_url = find_pricing_link(home_html, normalized_url)
-        if pricing_url:
-            try:
-                logger.info(f"Найдена ссылка на цены: {pricing_url}")
-                pricing_html = await http_fetch(pricing_url)
-                pricing_text = clean_html(pricing_html)
+        # Незавершенные загрузки отменяются при любом выходе: ранний return,
+        # ошибка очистки или отмена всего анализа
+        try:
+            # Текст главной из того же дерева (поиск ссылок его не меняет)
+            home_text = await asyncio.to_thread(clean_tree, home_tree)
+        
+            # clean_tree/clean_html уже возвращают текст без краевых пробелов,
+            # повторный strip() только копировал бы всю строку
+            if len(home_text) < 50:
+                logger.error(f"Получен пустой или слишком короткий контент с {normalized_url}")
+                return {"home_text": "", "requires_js": True}
+        
+            result = {
+                "home_text": home_text,
+                # Подозреваем JS если текста мало или страница - SPA
+                "requires_js": (
+                    len(home_text) < MIN_STATIC_TEXT_LEN
+                    or _SPA_MARKERS_RE.search(home_html) is not None
+                )
+            }
+        
+            # Берем первого по порядку кандидата с содержательным текстом,
+            # загрузку остальных отменяем
+            for pricing_url, pricing_task in zip(pricing_urls, pricing_tasks):
+                try:
+                    pricing_html = await pricing_task
+                    pricing_text = await asyncio.to_thread(clean_html, pricing_html)
                 
-                if pricing_text and len(pricing_text.strip()) > 50:
-                    result["pricing_url"] = pricing_url
-                    result["pricing_text"] = pricing_text
-                    logger.info(f"Загружена страница с ценами: {pricing_url}")
-                else:
-                    logger.warning(f"Страница с ценами пуста или слишком короткая: {pricing_url}")
+                    if len(pricing_text) > 50:
+                        result["pricing_url"] = pricing_url
+                        result["pricing_text"] = pricing_text
+                        logger.info("Загружена страница с ценами: {}", pricing_url)
+                        break
+                    else:
+                        logger.warning(f"Страница с ценами пуста или слишком короткая: {pricing_url}")
                     
-            except Exception as pricing_error:
-                logger.warning(f"Не удалось загрузить pricing {pricing_url}: {pricing_error}")
-        else:
-            logger.debug(f"Ссылка на цены не найдена для {normalized_url}")
+                except Exception as pricing_error:
+                    logger.warning(f"Не удалось загрузить pricing {pricing_url}: {pricing_error}")
+        finally:
+            await _cancel_tasks(pricing_tasks)
         
-        logger.info(f"HTTP fallback завершен для {normalized_url}: {len(result['home_text'])} символов главной")
+        logger.info("HTTP fallback завершен для {}: {} символов главной", normalized_url, len(result['home_text']))
         return result
     
     except Exception as e:
@@ -1,18 +1,55 @@
 from typing import Optional, Tuple, List, Dict, Any
-import json
+import asyncio
 import re
-import httpx
-from openai import OpenAI
+import orjson
+from openai import AsyncOpenAI
 from loguru import logger
 
 from app.core.settings import settings
+from app.core.utils import extract_json_object
 from app.core.retry import retry_on_llm_error
 from app.features.audit.schemas.models import FullResult
 from app.features.audit.adapters.cleaner import clean_html
+from app.features.audit.adapters.fetcher import http_fetch
+from app.features.audit.adapters.llm_cache import make_cache_key, load_cached_analysis, store_cached_analysis
 
 # Флаг для контроля использования web tools
 USE_WEB_TOOLS = False  # По умолчанию отключен для стабильности
 
+# Предкомпилированные паттерны для разбора ответов модели
+_MD_PREFIX_RE = re.compile(r'```json\s*')
+_MD_SUFFIX_RE = re.compile(r'```\s*$')
+_BULLET_RE = re.compile(r'^[-•*]\s*')
+
+# Лимиты входного текста для анализа (~8K и ~4K токенов для русского текста):
+# дальше начала страницы полезной для анализа информации почти нет
+MAX_HOME_CHARS = 32_000
+MAX_PRICING_CHARS = 16_000
+
+# Общий клиент OpenAI: переиспользует соединения между запросами
+_openai_client: Optional[AsyncOpenAI] = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Получение общего асинхронного клиента OpenAI (создается при первом обращении)"""
+    global _openai_client
+    
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
+        logger.debug("OpenAI клиент создан")
+    
+    return _openai_client
+
+
+async def close_openai_client() -> None:
+    """Закрытие общего клиента OpenAI (при остановке бота)"""
+    global _openai_client
+    
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+        logger.debug("OpenAI клиент закрыт")
+
 
 # System prompt для анализа маркетинговых лендингов
 ANALYSIS_SYSTEM_PROMPT = """
@@ -96,14 +133,14 @@ def clean_json_response(response_text: str) -> str:
     """
     try:
         # Убираем тройные кавычки и маркдаун
-        cleaned = re.sub(r'```json\s*', '', response_text)
-        cleaned = re.sub(r'```\s*$', '', cleaned)
+        cleaned = _MD_PREFIX_RE.sub('', response_text)
+        cleaned = _MD_SUFFIX_RE.sub('', cleaned)
         cleaned = cleaned.strip()
         
-        # Ищем первый JSON блок между фигурными скобками
-        json_match = re.search(r'\{.*\}', cleaned, re.DOTALL)
-        if json_match:
-            return json_match.group(0)
+        # Берем JSON от первой '{' до последней '}' (поиск строки без regex)
+        json_text = extract_json_object(cleaned)
+        if json_text:
+            return json_text
         
         return cleaned
         
@@ -112,6 +149,27 @@ def clean_json_response(response_text: str) -> str:
         return response_text
 
 
+def truncate_text(text: str, max_chars: int) -> str:
+    """
+    Обрезка текста до лимита символов по границе слова
+    
+    Args:
+        text: Исходный текст
+        max_chars: Максимальная длина
+        
+    Returns:
+        Текст не длиннее max_chars символов
+    """
+    if not text or len(text) <= max_chars:
+        return text
+    
+    # Режем по последнему пробелу, если он недалеко от лимита
+    cut = text.rfind(' ', 0, max_chars + 1)
+    if cut < max_chars * 0.9:
+        cut = max_chars
+    return text[:cut].rstrip()
+
+
 def parse_short_summary(summary_text: str) -> List[str]:
     """
     Парсинг краткой сводки в список пунктов
@@ -131,9 +189,9 @@ def parse_short_summary(summary_text: str) -> List[str]:
     
     for line in lines:
         line = line.strip()
-        if line and (line.startswith('-') or line.startswith('•') or line.startswith('*')):
+        if line[:1] in ('-', '•', '*'):
             # Убираем маркер и добавляем пункт
-            point = re.sub(r'^[-•*]\s*', '', line).strip()
+            point = _BULLET_RE.sub('', line).strip()
             if point:
                 points.append(point)
     
@@ -164,11 +222,27 @@ async def analyze_content(
         Кортеж (FullResult, краткая сводка в виде списка)
     """
     try:
-        logger.info(f"Начинаем анализ контента: {len(home_text)} символов главной, {len(pricing_text or '')} символов цен")
+        logger.info("Начинаем анализ контента: {} символов главной, {} символов цен", len(home_text), len(pricing_text or ''))
         
-        # Создаем асинхронный клиент OpenAI
-        from openai import AsyncOpenAI
-        client = AsyncOpenAI(api_key=settings.openai_api_key)
+        # Ограничиваем объем входа: стоимость и время ответа растут с длиной промпта
+        trimmed_home = truncate_text(home_text, MAX_HOME_CHARS)
+        trimmed_pricing = truncate_text(pricing_text, MAX_PRICING_CHARS)
+        if trimmed_home is not home_text or trimmed_pricing is not pricing_text:
+            logger.info(
+                "Текст для анализа обрезан: главная {} -> {}, цены {} -> {} символов",
+                len(home_text or ''), len(trimmed_home or ''),
+                len(pricing_text or ''), len(trimmed_pricing or '')
+            )
+        home_text, pricing_text = trimmed_home, trimmed_pricing
+        
+        # Тот же контент уже анализировался - повторный запрос к GPT-4o не нужен
+        cache_key = make_cache_key(home_text, pricing_text, pricing_url)
+        cached = await load_cached_analysis(cache_key)
+        if cached is not None:
+            logger.info("Анализ взят из кэша, запрос к GPT-4o пропущен")
+            return cached
+        
+        client = get_openai_client()
         
         # Формируем пользовательский промпт
         user_content = ANALYSIS_USER_TEMPLATE.format(
@@ -177,8 +251,9 @@ async def analyze_content(
             PRICING_URL=pricing_url or ""
         )
         
-        # Делаем асинхронный запрос к GPT-4o
-        response = await client.chat.completions.create(
+        # Делаем асинхронный потоковый запрос к GPT-4o: ответ собирается
+        # по мере генерации, без ожидания полного тела
+        stream = await client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
@@ -186,27 +261,37 @@ async def analyze_content(
             ],
             temperature=0.3,
             max_tokens=4000,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True}
         )
         
-        # Логируем детали OpenAI запроса
-        request_id = getattr(response, 'id', 'unknown')
-        logger.info(f"OpenAI запрос ID: {request_id}")
-        logger.debug(f"OpenAI модель: {response.model}")
-        logger.debug(f"OpenAI usage: {response.usage}")
+        parts = []
+        request_id, model, usage = 'unknown', None, None
+        async for chunk in stream:
+            request_id, model = chunk.id, chunk.model
+            # usage приходит отдельным последним чанком без choices
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices:
+                parts.append(chunk.choices[0].delta.content or "")
+        
+        # Детали OpenAI запроса нужны только для диагностики
+        logger.debug("OpenAI запрос ID: {}, модель: {}, usage: {}", request_id, model, usage)
         
         # Извлекаем ответ
-        raw_content = response.choices[0].message.content
-        logger.debug(f"Получен ответ от GPT-4o: {len(raw_content)} символов")
-        logger.debug(f"Полный ответ GPT-4o: {raw_content[:1000]}...")  # Первые 1000 символов для диагностики
+        raw_content = ''.join(parts)
+        logger.debug("Получен ответ от GPT-4o: {} символов", len(raw_content))
+        # Срез строки строится только если DEBUG включен
+        logger.opt(lazy=True).debug("Полный ответ GPT-4o: {}...", lambda: raw_content[:1000])  # Первые 1000 символов для диагностики
         
         # Очищаем JSON от лишних обёрток
         cleaned_json = clean_json_response(raw_content)
         
         # Парсим JSON
         try:
-            data = json.loads(cleaned_json)
-        except json.JSONDecodeError as e:
+            data = orjson.loads(cleaned_json)
+        except orjson.JSONDecodeError as e:
             logger.error(f"Ошибка парсинга JSON: {e}")
             logger.error(f"Содержимое ответа: {cleaned_json[:500]}...")
             raise ValueError(f"GPT-4o вернул некорректный JSON: {e}")
@@ -260,6 +345,8 @@ async def analyze_content(
             ]
             short_summary = [s for s in short_summary if s][:4]
         
+        await store_cached_analysis(cache_key, full_result, short_summary)
+        
         logger.info("Анализ GPT-4o завершен успешно")
         return full_result, short_summary
         
@@ -279,24 +366,20 @@ async def fetch_url(url: str) -> Dict[str, str]:
         Словарь с данными: {"url", "html", "text"}
     """
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-            response = await client.get(url, headers=headers, follow_redirects=True)
-            response.raise_for_status()
-            
-            html_content = response.text
-            text_content = clean_html(html_content)
-            
-            logger.debug(f"Tool fetch_url: {url} -> {len(text_content)} символов")
-            
-            return {
-                "url": url,
-                "html": html_content[:10000],  # Ограничиваем размер
-                "text": text_content[:8000]     # Ограничиваем размер для GPT
-            }
-            
+        # Общий клиент и ограничения загрузчика (размер, тип содержимого, повторы)
+        html_content = await http_fetch(url)
+        
+        # Очищаем один раз и вне event loop
+        text_content = await asyncio.to_thread(clean_html, html_content)
+        
+        logger.debug("Tool fetch_url: {} -> {} символов", url, len(text_content))
+        
+        return {
+            "url": url,
+            "html": html_content[:10000],  # Ограничиваем размер
+            "text": text_content[:8000]     # Ограничиваем размер для GPT
+        }
+        
     except Exception as e:
         logger.error(f"Ошибка tool fetch_url для {url}: {e}")
         return {"url": url, "html": "", "text": f"Ошибка загрузки: {str(e)}"}
@@ -312,7 +395,7 @@ async def web_search(query: str) -> Dict[str, List[Dict]]:
     Returns:
         Словарь с пустыми результатами
     """
-    logger.debug(f"Tool web_search вызван с запросом: {query}")
+    logger.debug("Tool web_search вызван с запросом: {}", query)
     return {"results": []}
 
 
@@ -340,6 +423,51 @@ TOOL_FUNCTIONS = {
     "web_search": web_search
 }
 
+# Максимум одновременно выполняемых tool calls в одном ответе модели
+MAX_PARALLEL_TOOL_CALLS = 5
+
+
+async def _execute_tool_call(tool_call: Any, semaphore: asyncio.Semaphore) -> str:
+    """
+    Выполнение одного tool call
+    
+    Args:
+        tool_call: Вызов инструмента из ответа модели
+        semaphore: Ограничение одновременных вызовов
+        
+    Returns:
+        JSON строка с результатом или ошибкой
+    """
+    function_name = tool_call.function.name
+    
+    if function_name not in TOOL_FUNCTIONS:
+        logger.error(f"Неизвестный tool: {function_name}")
+        return orjson.dumps({
+            "error": f"Неизвестная функция: {function_name}"
+        }).decode()
+    
+    try:
+        # Некорректные аргументы от модели - ошибка только этого вызова,
+        # остальные tool calls в gather выполняются
+        function_args = orjson.loads(tool_call.function.arguments)
+        logger.info("Выполняем tool: {} с аргументами: {}", function_name, function_args)
+        
+        # Вызываем функцию
+        async with semaphore:
+            if function_name == "fetch_url":
+                result = await TOOL_FUNCTIONS[function_name](function_args["url"])
+            else:
+                result = await TOOL_FUNCTIONS[function_name](**function_args)
+        
+        logger.debug("Tool {} выполнен успешно", function_name)
+        return orjson.dumps(result).decode()
+        
+    except Exception as tool_error:
+        logger.error(f"Ошибка tool {function_name}: {tool_error}")
+        return orjson.dumps({
+            "error": f"Ошибка выполнения {function_name}: {str(tool_error)}"
+        }).decode()
+
 
 @retry_on_llm_error
 async def run_with_tools(messages: List[Dict[str, str]]) -> str:
@@ -353,14 +481,14 @@ async def run_with_tools(messages: List[Dict[str, str]]) -> str:
         Финальный текстовый ответ от модели
     """
     try:
-        client = OpenAI(api_key=settings.openai_api_key)
+        client = get_openai_client()
         current_messages = messages.copy()
         max_iterations = 5  # Защита от бесконечных циклов
         iteration = 0
         
         while iteration < max_iterations:
             iteration += 1
-            logger.debug(f"Tool цикл, итерация {iteration}")
+            logger.debug("Tool цикл, итерация {}", iteration)
             
             # Определяем tools в зависимости от флага
             tools = AVAILABLE_TOOLS if USE_WEB_TOOLS else None
@@ -379,7 +507,7 @@ async def run_with_tools(messages: List[Dict[str, str]]) -> str:
             
             # Если нет tool calls, возвращаем финальный ответ
             if not message.tool_calls:
-                logger.debug(f"Tool цикл завершен за {iteration} итераций")
+                logger.debug("Tool цикл завершен за {} итераций", iteration)
                 return message.content
             
             # Добавляем ответ модели в историю
@@ -389,40 +517,19 @@ async def run_with_tools(messages: List[Dict[str, str]]) -> str:
                 "tool_calls": [tc.model_dump() for tc in message.tool_calls]
             })
             
-            # Выполняем каждый tool call
-            for tool_call in message.tool_calls:
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                
-                logger.info(f"Выполняем tool: {function_name} с аргументами: {function_args}")
-                
-                if function_name in TOOL_FUNCTIONS:
-                    try:
-                        # Вызываем функцию
-                        if function_name == "fetch_url":
-                            result = await TOOL_FUNCTIONS[function_name](function_args["url"])
-                        else:
-                            result = await TOOL_FUNCTIONS[function_name](**function_args)
-                        
-                        result_content = json.dumps(result, ensure_ascii=False)
-                        logger.debug(f"Tool {function_name} выполнен успешно")
-                        
-                    except Exception as tool_error:
-                        result_content = json.dumps({
-                            "error": f"Ошибка выполнения {function_name}: {str(tool_error)}"
-                        }, ensure_ascii=False)
-                        logger.error(f"Ошибка tool {function_name}: {tool_error}")
-                else:
-                    result_content = json.dumps({
-                        "error": f"Неизвестная функция: {function_name}"
-                    }, ensure_ascii=False)
-                    logger.error(f"Неизвестный tool: {function_name}")
-                
+            # Выполняем tool calls параллельно (ограничивая одновременные вызовы),
+            # результаты добавляем в историю в исходном порядке
+            semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOL_CALLS)
+            results = await asyncio.gather(
+                *(_execute_tool_call(tool_call, semaphore) for tool_call in message.tool_calls)
+            )
+            
+            for tool_call, result_content in zip(message.tool_calls, results):
                 # Добавляем результат tool в историю
                 current_messages.append({
                     "role": "tool",
                     "tool_call_id": tool_call.id,
-                    "name": function_name,
+                    "name": tool_call.function.name,
                     "content": result_content
                 })
         
@@ -0,0 +1,136 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import orjson
+from loguru import logger
+
+from app.features.audit.schemas.models import FullResult
+from app.storage.sqlite import get_llm_cache, save_llm_cache
+
+# Время жизни результата анализа (сутки)
+LLM_CACHE_TTL = 24 * 60 * 60
+
+# Максимальное количество результатов в кэше
+LLM_CACHE_MAX_SIZE = 256
+
+# ключ -> (момент истечения, результат, краткая сводка)
+_cache: "OrderedDict[str, Tuple[float, FullResult, List[str]]]" = OrderedDict()
+
+
+def make_cache_key(
+    home_text: str,
+    pricing_text: Optional[str] = None,
+    pricing_url: Optional[str] = None
+) -> str:
+    """
+    Ключ кэша по содержимому страниц
+
+    Args:
+        home_text: Текст главной страницы
+        pricing_text: Текст страницы с ценами
+        pricing_url: URL страницы с ценами
+
+    Returns:
+        Хэш содержимого (32 hex символа)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    # Разделитель не встречается в тексте - части не склеиваются в одинаковый ключ
+    for part in (home_text, pricing_text, pricing_url):
+        digest.update((part or "").encode('utf-8', errors='replace'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def get_cached_analysis(key: str) -> Optional[Tuple[FullResult, List[str]]]:
+    """
+    Получение результата анализа из кэша
+
+    Args:
+        key: Ключ из make_cache_key
+
+    Returns:
+        Копия (FullResult, краткая сводка) или None если записи нет или она устарела
+    """
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+
+    expires_at, full_result, short_summary = entry
+    if expires_at < time.monotonic():
+        del _cache[key]
+        return None
+
+    _cache.move_to_end(key)
+    logger.debug("Результат анализа взят из кэша: {}", key)
+    # Отдаем копии, чтобы вызывающий код не изменил закэшированные данные
+    return full_result.model_copy(), list(short_summary)
+
+
+def set_cached_analysis(key: str, full_result: FullResult, short_summary: List[str]) -> None:
+    """
+    Сохранение результата анализа в кэш
+
+    Args:
+        key: Ключ из make_cache_key
+        full_result: Результат анализа
+        short_summary: Краткая сводка
+    """
+    _cache[key] = (time.monotonic() + LLM_CACHE_TTL, full_result.model_copy(), list(short_summary))
+    _cache.move_to_end(key)
+
+    # Вытесняем самые старые записи
+    while len(_cache) > LLM_CACHE_MAX_SIZE:
+        _cache.popitem(last=False)
+
+
+async def load_cached_analysis(key: str) -> Optional[Tuple[FullResult, List[str]]]:
+    """
+    Получение результата анализа из памяти, а при промахе - из БД
+    
+    Args:
+        key: Ключ из make_cache_key
+        
+    Returns:
+        Копия (FullResult, краткая сводка) или None если результата нет
+    """
+    cached = get_cached_analysis(key)
+    if cached is not None:
+        return cached
+    
+    stored = await get_llm_cache(key, LLM_CACHE_TTL)
+    if stored is None:
+        return None
+    
+    try:
+        full_result = FullResult.model_validate_json(stored[0])
+        short_summary = orjson.loads(stored[1])
+    except Exception as e:
+        logger.error(f"Ошибка чтения сохраненного анализа {key}: {e}")
+        return None
+    
+    logger.debug("Результат анализа взят из БД: {}", key)
+    set_cached_analysis(key, full_result, short_summary)
+    return full_result, short_summary
+
+
+async def store_cached_analysis(key: str, full_result: FullResult, short_summary: List[str]) -> None:
+    """
+    Сохранение результата анализа в память и в БД
+    
+    Args:
+        key: Ключ из make_cache_key
+        full_result: Результат анализа
+        short_summary: Краткая сводка
+    """
+    set_cached_analysis(key, full_result, short_summary)
+    await save_llm_cache(
+        key,
+        full_result.model_dump_json(),
+        orjson.dumps(short_summary).decode('utf-8')
+    )
+
+
+def clear_llm_cache() -> None:
+    """Очистка кэша результатов анализа"""
+    _cache.clear()
@@ -1,6 +1,8 @@
+import asyncio
 import gspread
+from functools import lru_cache
 from google.oauth2.service_account import Credentials
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
 from loguru import logger
 
 from app.core.settings import settings
@@ -39,28 +41,45 @@ SHEET_HEADERS = [
 ]
 
 
+# Таблицы, в которых заголовки уже проверены в этом процессе
+_headered_sheets: Set[str] = set()
+
+# Блокировки проверки заголовков по таблицам: ждут только записи в ту же таблицу
+_headers_locks: Dict[str, asyncio.Lock] = {}
+
+# Области доступа сервисного аккаунта
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+
+@lru_cache(maxsize=1)
+def _load_credentials() -> Credentials:
+    """
+    Загрузка credentials сервисного аккаунта (файл читается один раз)
+    
+    Обновление токена Credentials выполняет сами, поэтому объект
+    используется все время работы процесса.
+    """
+    return Credentials.from_service_account_file(
+        settings.google_service_json_path,
+        scopes=SCOPES
+    )
+
+
+@lru_cache(maxsize=1)
 def get_gspread_client() -> gspread.Client:
-    """Создание авторизованного клиента Google Sheets"""
+    """Создание авторизованного клиента Google Sheets (один на процесс)"""
     try:
-        # Определяем области доступа
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        
-        # Создаем credentials из service account файла
-        credentials = Credentials.from_service_account_file(
-            settings.google_service_json_path,
-            scopes=scopes
-        )
-        
         # Создаем клиент
-        client = gspread.authorize(credentials)
+        client = gspread.authorize(_load_credentials())
         
         logger.debug("Google Sheets клиент создан успешно")
         return client
         
     except Exception as e:
+        # lru_cache не запоминает исключения - следующий вызов попробует снова
         logger.error(f"Ошибка создания Google Sheets клиента: {e}")
         raise
 
@@ -68,11 +87,7 @@ def get_gspread_client() -> gspread.Client:
 async def get_service_email() -> str:
     """Получение email сервисного аккаунта для предоставления доступа"""
     try:
-        credentials = Credentials.from_service_account_file(
-            settings.google_service_json_path
-        )
-        
-        service_email = credentials.service_account_email
+        service_email = _load_credentials().service_account_email
         logger.debug(f"Service account email: {service_email}")
         return service_email
         
@@ -81,52 +96,83 @@ async def get_service_email() -> str:
         raise
 
 
+def _open_worksheet(sheet_id: str) -> gspread.Worksheet:
+    """Открытие первого листа таблицы (блокирующий HTTP запрос)"""
+    return get_gspread_client().open_by_key(sheet_id).sheet1
+
+
+def _ensure_headers_sync(sheet_id: str) -> None:
+    """Синхронная часть ensure_headers, выполняется в отдельном потоке"""
+    worksheet = _open_worksheet(sheet_id)
+    
+    # Проверяем существующие заголовки
+    try:
+        existing_headers = worksheet.row_values(1)
+        
+        # Если заголовки уже есть и совпадают, ничего не делаем
+        if existing_headers == SHEET_HEADERS:
+            logger.debug(f"Заголовки в таблице {sheet_id} уже корректные")
+            return
+            
+        # Если заголовки есть но не совпадают, логируем предупреждение
+        if existing_headers:
+            logger.warning(f"Заголовки в таблице {sheet_id} не совпадают с ожидаемыми")
+            return
+            
+    except Exception:
+        # Если не удалось получить заголовки, значит таблица пустая
+        pass
+    
+    # Создаем заголовки
+    worksheet.insert_row(SHEET_HEADERS, index=1)
+    
+    # Форматируем заголовки (жирный шрифт)
+    try:
+        worksheet.format('1:1', {
+            'textFormat': {'bold': True},
+            'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
+        })
+    except Exception as format_error:
+        logger.warning(f"Не удалось отформатировать заголовки: {format_error}")
+    
+    logger.info(f"Заголовки созданы в таблице {sheet_id}")
+
+
+def _append_rows_sync(sheet_id: str, rows: List[List[str]]) -> None:
+    """Добавление строк в конец первого листа одним запросом values.append"""
+    _open_worksheet(sheet_id).append_rows(rows, value_input_option="RAW")
+
+
 @retry_on_api_error
 async def ensure_headers(sheet_id: str) -> None:
     """
     Проверка и создание заголовков в Google Sheets
     
+    gspread синхронный, поэтому запросы выполняются в отдельном потоке
+    и не блокируют event loop бота. Таблица проверяется один раз за время
+    работы процесса, дальше вызов не делает запросов к API.
+    
     Args:
         sheet_id: ID Google таблицы
     """
+    if sheet_id in _headered_sheets:
+        return
+    
     try:
-        client = get_gspread_client()
-        sheet = client.open_by_key(sheet_id)
-        
-        # Работаем с первым листом
-        worksheet = sheet.sheet1
-        
-        # Проверяем существующие заголовки
-        try:
-            existing_headers = worksheet.row_values(1)
-            
-            # Если заголовки уже есть и совпадают, ничего не делаем
-            if existing_headers == SHEET_HEADERS:
-                logger.debug(f"Заголовки в таблице {sheet_id} уже корректные")
-                return
-                
-            # Если заголовки есть но не совпадают, логируем предупреждение
-            if existing_headers:
-                logger.warning(f"Заголовки в таблице {sheet_id} не совпадают с ожидаемыми")
+        # Блокировка не дает двум одновременным записям в одну таблицу
+        # дважды вставить заголовки; другие таблицы ее не ждут
+        lock = _headers_locks.get(sheet_id)
+        if lock is None:
+            lock = _headers_locks[sheet_id] = asyncio.Lock()
+        
+        async with lock:
+            if sheet_id in _headered_sheets:
                 return
-                
-        except Exception:
-            # Если не удалось получить заголовки, значит таблица пустая
-            pass
-        
-        # Создаем заголовки
-        worksheet.insert_row(SHEET_HEADERS, index=1)
-        
-        # Форматируем заголовки (жирный шрифт)
-        try:
-            worksheet.format('1:1', {
-                'textFormat': {'bold': True},
-                'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
-            })
-        except Exception as format_error:
-            logger.warning(f"Не удалось отформатировать заголовки: {format_error}")
-        
-        logger.info(f"Заголовки созданы в таблице {sheet_id}")
+            
+            await asyncio.to_thread(_ensure_headers_sync, sheet_id)
+            _headered_sheets.add(sheet_id)
+            # Дальше таблица пропускается по _headered_sheets, блокировка не нужна
+            _headers_locks.pop(sheet_id, None)
         
     except Exception as e:
         logger.error(f"Ошибка создания заголовков в таблице {sheet_id}: {e}")
@@ -138,20 +184,16 @@ async def write_row(sheet_id: str, row_data: List[str]) -> None:
     """
     Запись строки в конец Google Sheets
     
+    Заголовки не проверяются: вызывающий код делает ensure_headers сам,
+    один раз перед записью.
+    
     Args:
         sheet_id: ID Google таблицы
         row_data: Список значений для записи
     """
     try:
-        client = get_gspread_client()
-        sheet = client.open_by_key(sheet_id)
-        worksheet = sheet.sheet1
-        
-        # Убеждаемся что заголовки есть
-        await ensure_headers(sheet_id)
-        
         # Добавляем строку в конец
-        worksheet.append_row(row_data)
+        await asyncio.to_thread(_append_rows_sync, sheet_id, [row_data])
         
         logger.info(f"Строка записана в таблицу {sheet_id}: {len(row_data)} колонок")
         
@@ -160,6 +202,29 @@ async def write_row(sheet_id: str, row_data: List[str]) -> None:
         raise
 
 
+@retry_on_api_error
+async def write_rows(sheet_id: str, rows: List[List[str]]) -> None:
+    """
+    Запись нескольких строк в конец Google Sheets одним запросом
+    
+    Args:
+        sheet_id: ID Google таблицы
+        rows: Строки для записи (списки значений)
+    """
+    if not rows:
+        return
+    
+    try:
+        # Один запрос values.append вместо запроса на каждую строку
+        await asyncio.to_thread(_append_rows_sync, sheet_id, rows)
+        
+        logger.info(f"Записано {len(rows)} строк в таблицу {sheet_id}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка записи строк в таблицу {sheet_id}: {e}")
+        raise
+
+
 async def test_sheet_access(sheet_id: str) -> bool:
     """
     Тест доступа к Google таблице
@@ -171,10 +236,8 @@ async def test_sheet_access(sheet_id: str) -> bool:
         True если доступ есть
     """
     try:
-        client = get_gspread_client()
-        sheet = client.open_by_key(sheet_id)
-        
         # Пробуем получить название таблицы
+        sheet = await asyncio.to_thread(get_gspread_client().open_by_key, sheet_id)
         title = sheet.title
         logger.info(f"Доступ к таблице '{title}' подтвержден")
         return True
@@ -1,17 +1,31 @@
 # Сохранение и управление результатами аудита
 
-import json
+import asyncio
+import orjson
+from datetime import datetime
 from typing import Dict, List, Optional
 from loguru import logger
 
 from app.storage.sqlite import (
     get_user_sheet_id,
     save_pending_result,
-    fetch_unwritten_results,
-    mark_written
+    iter_unwritten_results,
+    mark_written_many
 )
-from app.features.audit.adapters.sheets import ensure_headers, write_row
-from app.features.audit.schemas.models import RowForSheet
+from app.features.audit.adapters.sheets import ensure_headers, write_row, write_rows
+from app.features.audit.schemas.models import FullResult
+
+# Поля анализа в порядке колонок таблицы (совпадает с RowForSheet.to_sheet_row)
+_SHEET_FIELD_ORDER = tuple(FullResult.model_fields)
+
+# Формат даты в первой колонке таблицы
+SHEET_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Переносы по пользователям: user_id -> (блокировка, число ожидающих и выполняющихся).
+# Повторное подключение таблицы ждет текущий перенос, иначе обе задачи
+# прочитали бы одну пачку до mark_written_many и записали бы ее дважды
+_flush_locks: Dict[str, asyncio.Lock] = {}
+_flush_users: Dict[str, int] = {}
 
 
 async def write_or_defer(user_id: str, url: str, result_json: str) -> None:
@@ -59,12 +73,42 @@ async def flush_pending_to_user_sheet(user_id: str) -> int:
     """
     Перенос всех отложенных результатов в таблицу пользователя
     
+    Переносы одного пользователя выполняются по очереди: следующий начинается
+    после завершения текущего и переносит только оставшиеся результаты.
+    
     Args:
         user_id: ID пользователя
         
     Returns:
         Количество перенесенных результатов
     """
+    lock = _flush_locks.get(user_id)
+    if lock is None:
+        lock = _flush_locks[user_id] = asyncio.Lock()
+    _flush_users[user_id] = _flush_users.get(user_id, 0) + 1
+    
+    try:
+        async with lock:
+            return await _flush_pending(user_id)
+    finally:
+        # Блокировку без ожидающих переносов удаляем, чтобы словарь не рос
+        _flush_users[user_id] -= 1
+        if not _flush_users[user_id]:
+            del _flush_users[user_id]
+            del _flush_locks[user_id]
+
+
+async def _flush_pending(user_id: str) -> int:
+    """
+    Перенос отложенных результатов (вызывается под блокировкой пользователя)
+    
+    Args:
+        user_id: ID пользователя
+        
+    Returns:
+        Количество перенесенных результатов
+    """
+    counter = 0
     try:
         # Проверяем есть ли у пользователя таблица
         user_sheet = await get_user_sheet_id(user_id)
@@ -72,48 +116,34 @@ async def flush_pending_to_user_sheet(user_id: str) -> int:
             logger.debug(f"У пользователя {user_id} нет подключенной таблицы")
             return 0
         
-        # Получаем отложенные результаты
-        results = await fetch_unwritten_results(user_id)
-        if not results:
+        # Переносим отложенные результаты пачками: в памяти только одна пачка,
+        # каждая записывается одним запросом и отмечается одним UPDATE
+        async for batch in iter_unwritten_results(user_id):
+            if not counter:
+                # Убеждаемся что заголовки есть
+                await ensure_headers(user_sheet)
+            
+            rows = [
+                convert_json_to_row(result['result_json'], user_id, result['url'])
+                for result in batch
+            ]
+            await write_rows(user_sheet, rows)
+            
+            await mark_written_many([result['id'] for result in batch])
+            counter += len(batch)
+            logger.debug(f"Перенесено {counter} результатов в таблицу {user_sheet}")
+        
+        if not counter:
             logger.debug(f"У пользователя {user_id} нет отложенных результатов")
             return 0
         
-        logger.info(f"Начинаем перенос {len(results)} результатов в таблицу {user_sheet}")
-        
-        # Убеждаемся что заголовки есть
-        await ensure_headers(user_sheet)
-        
-        # Переносим каждый результат
-        counter = 0
-        for result in results:
-            try:
-                # Конвертируем JSON в строку для таблицы
-                row_data = convert_json_to_row(
-                    result['result_json'], 
-                    user_id, 
-                    result['url']
-                )
-                
-                # Записываем в таблицу
-                await write_row(user_sheet, row_data)
-                
-                # Отмечаем как записанный
-                await mark_written(result['id'])
-                
-                counter += 1
-                logger.debug(f"Результат {result['id']} перенесен успешно")
-                
-            except Exception as row_error:
-                logger.error(f"Ошибка переноса результата {result['id']}: {row_error}")
-                # Продолжаем с другими результатами
-                continue
-        
-        logger.info(f"Перенесено {counter} из {len(results)} результатов в таблицу {user_sheet}")
+        logger.info(f"Перенесено {counter} результатов в таблицу {user_sheet}")
         return counter
         
     except Exception as e:
         logger.error(f"Ошибка переноса отложенных результатов для {user_id}: {e}")
-        return 0
+        # Уже перенесенные пачки отмечены в БД и учитываются в результате
+        return counter
 
 
 def convert_json_to_row(result_json: str, user_id: str, url: str) -> List[str]:
@@ -130,41 +160,28 @@ def convert_json_to_row(result_json: str, user_id: str, url: str) -> List[str]:
     """
     try:
         # Парсим JSON
-        data = json.loads(result_json)
+        data = orjson.loads(result_json)
         
         # Извлекаем данные результата и метаданные
-        full_result_data = data.get('full_result', {})
-        pricing_url = data.get('pricing_url', '')
-        
-        # Создаем объект RowForSheet с пустыми значениями по умолчанию
-        row_data = RowForSheet(
-            timestamp="",  # Будет заполнено автоматически
-            user_id=user_id,
-            analyzed_url=url,
-            pricing_url=pricing_url,
-            **{field: full_result_data.get(field, '') for field in [
-                'offer_first_screen', 'cta_first_screen', 'utp_formula',
-                'product_services', 'education_program', 'all_cta',
-                'benefits', 'target_audience_pains', 'prices_tariffs',
-                'installment_payment', 'promotions', 'bonuses_gifts',
-                'guarantees', 'trust_factors', 'lead_magnets',
-                'contacts_social', 'online_chat', 'application_forms',
-                'main_structure', 'faq', 'marketing_insights',
-                'growth_hypotheses', 'brief_summary', 'notes'
-            ]}
-        )
+        full_result_data = data.get('full_result') or {}
+        pricing_url = data.get('pricing_url') or ''
         
-        # Конвертируем в список для записи в таблицу
-        return row_data.to_sheet_row()
+        # Собираем строку таблицы напрямую, без промежуточной модели RowForSheet:
+        # значения уже прошли валидацию FullResult при анализе
+        return [
+            datetime.now().strftime(SHEET_TIMESTAMP_FORMAT),
+            user_id,
+            url,
+            pricing_url
+        ] + [full_result_data.get(field, '') for field in _SHEET_FIELD_ORDER]
         
     except Exception as e:
         logger.error(f"Ошибка конвертации JSON в строку таблицы: {e}")
         logger.error(f"JSON содержимое: {result_json[:500]}...")
         
         # Возвращаем базовую строку с ошибкой
-        from datetime import datetime
         return [
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            datetime.now().strftime(SHEET_TIMESTAMP_FORMAT),
             user_id,
             url,
             "",  # pricing_url
@@ -1,21 +1,86 @@
 # Оркестратор процесса аудита
 
-import json
-from datetime import datetime
-from typing import Dict, Any
+import asyncio
+import time
+import orjson
+from typing import Dict, Any, List, Optional, Tuple
 from loguru import logger
 
 from app.core.utils import normalize_url
 from app.core.settings import settings
-from app.storage.sqlite import (
-    ensure_user_limit,
-    can_run,
-    increment_counter,
-    get_user_sheet_id
-)
+from app.storage.sqlite import begin_audit, release_audit
 from app.features.audit.adapters.fetcher import get_content_bundle
 from app.features.audit.adapters.llm import analyze_content
 from app.features.audit.services.persist import write_or_defer
+from app.features.audit.schemas.models import FullResult
+
+# Ограничение одновременных загрузок и запросов к LLM: остальные анализы
+# ждут своей очереди, не перегружая executor и лимиты OpenAI
+_audit_semaphore = asyncio.Semaphore(settings.max_concurrent_audits)
+
+# Анализы, которые выполняются сейчас: нормализованный URL -> задача
+_inflight: Dict[str, "asyncio.Task[Optional[Tuple[FullResult, List[str], Optional[str]]]]"] = {}
+
+
+async def _fetch_and_analyze(normalized_url: str) -> Optional[Tuple[FullResult, List[str], Optional[str]]]:
+    """
+    Загрузка контента сайта и анализ через LLM
+    
+    Args:
+        normalized_url: Нормализованный URL
+        
+    Returns:
+        (FullResult, краткая сводка, URL страницы цен) или None если контент не получен
+    """
+    if _audit_semaphore.locked():
+        logger.info(
+            f"Все {settings.max_concurrent_audits} слотов анализа заняты, "
+            f"{normalized_url} ожидает в очереди"
+        )
+
+    async with _audit_semaphore:
+        logger.info("Загружаем контент сайта...")
+        bundle = await get_content_bundle(normalized_url)
+        
+        if not bundle.get("home_text"):
+            logger.error(f"Не удалось получить контент с {normalized_url}")
+            return None
+        
+        logger.info(f"Контент загружен: {len(bundle['home_text'])} символов главной, pricing: {bool(bundle.get('pricing_text'))}")
+        
+        # Анализируем контент через LLM
+        logger.info("Отправляем на анализ GPT-4o...")
+        full_result, short_summary = await analyze_content(
+            home_text=bundle["home_text"],
+            pricing_text=bundle.get("pricing_text"),
+            pricing_url=bundle.get("pricing_url")
+        )
+    
+    logger.info("Анализ GPT-4o завершен")
+    return full_result, short_summary, bundle.get("pricing_url")
+
+
+async def _fetch_and_analyze_once(normalized_url: str) -> Optional[Tuple[FullResult, List[str], Optional[str]]]:
+    """
+    Загрузка и анализ без дублирования: одновременные запросы одного URL
+    ждут общую задачу вместо повторной загрузки и вызова LLM
+    
+    Args:
+        normalized_url: Нормализованный URL
+        
+    Returns:
+        Результат _fetch_and_analyze
+    """
+    task = _inflight.get(normalized_url)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_analyze(normalized_url))
+        _inflight[normalized_url] = task
+        task.add_done_callback(lambda _: _inflight.pop(normalized_url, None))
+    else:
+        logger.info(f"Анализ {normalized_url} уже выполняется, ожидаем его результат")
+    
+    # shield: отмена одного ожидающего не прерывает анализ для остальных
+    return await asyncio.shield(task)
 
 
 async def run_audit(user_id: str, url: str) -> Dict[str, Any]:
@@ -29,19 +94,20 @@ async def run_audit(user_id: str, url: str) -> Dict[str, Any]:
     Returns:
         Словарь с результатом: {"ok": bool, "reason"?: str, "short_summary"?: List, "written_now"?: bool}
     """
+    reserved = completed = False
     try:
         logger.info(f"Начинаем анализ для пользователя {user_id}, URL: {url}")
         
-        # Проверяем и создаем лимиты пользователя
-        await ensure_user_limit(user_id, settings.default_user_limit)
-        
-        # Проверяем может ли пользователь запустить анализ
-        if not await can_run(user_id, settings.default_user_limit):
+        # Создаем лимит, проверяем и резервируем анализ и узнаем про таблицу
+        # за одну короткую транзакцию; загрузка и LLM идут уже без блокировки БД
+        allowed, sheet_id = await begin_audit(user_id, settings.default_user_limit)
+        if not allowed:
             logger.warning(f"Пользователь {user_id} превысил лимит анализов")
             return {
                 "ok": False,
                 "reason": "limit"
             }
+        reserved = True
         
         # Нормализуем URL
         normalized_url = normalize_url(url)
@@ -54,47 +120,29 @@ async def run_audit(user_id: str, url: str) -> Dict[str, Any]:
         
         logger.info(f"Нормализованный URL: {normalized_url}")
         
-        # Получаем контент сайта
-        logger.info("Загружаем контент сайта...")
-        bundle = await get_content_bundle(normalized_url)
-        
-        if not bundle.get("home_text"):
-            logger.error(f"Не удалось получить контент с {normalized_url}")
+        # Получаем контент сайта и анализируем его
+        analysis = await _fetch_and_analyze_once(normalized_url)
+        if analysis is None:
             return {
                 "ok": False,
                 "reason": "fetch_failed"
             }
-        
-        logger.info(f"Контент загружен: {len(bundle['home_text'])} символов главной, pricing: {bool(bundle.get('pricing_text'))}")
-        
-        # Анализируем контент через LLM
-        logger.info("Отправляем на анализ GPT-4o...")
-        full_result, short_summary = await analyze_content(
-            home_text=bundle["home_text"],
-            pricing_text=bundle.get("pricing_text"),
-            pricing_url=bundle.get("pricing_url")
-        )
-        
-        logger.info("Анализ GPT-4o завершен")
+        full_result, short_summary, pricing_url = analysis
         
         # Формируем данные для сохранения
-        now_iso = datetime.now().isoformat()
         result_data = {
             "full_result": full_result.model_dump(),  # Исправлено: dict() -> model_dump()
-            "pricing_url": bundle.get("pricing_url"),
-            "timestamp": now_iso,
+            "pricing_url": pricing_url,
+            "timestamp": int(time.time()),  # Unix-время, в таблицу пишется своя дата
             "short_summary": short_summary  # Теперь это уже List[str]
         }
         
-        # Проверяем есть ли у пользователя таблица
-        user_has_sheet = bool(await get_user_sheet_id(user_id))
+        user_has_sheet = bool(sheet_id)
         
         # Записываем результат (сразу в таблицу или отложенно)
-        await write_or_defer(user_id, normalized_url, json.dumps(result_data, ensure_ascii=False))
-        
-        # Увеличиваем счетчик использования
-        await increment_counter(user_id)
+        await write_or_defer(user_id, normalized_url, orjson.dumps(result_data).decode('utf-8'))
         
+        completed = True
         logger.info(f"Анализ завершен для пользователя {user_id}, таблица подключена: {user_has_sheet}")
         
         return {
@@ -110,6 +158,10 @@ async def run_audit(user_id: str, url: str) -> Dict[str, Any]:
             "reason": "internal_error",
             "error": str(e)
         }
+    finally:
+        # Лимит расходуется только на завершенные анализы
+        if reserved and not completed:
+            await release_audit(user_id)
 
 
 async def run_audit_service(user_id: str, url: str, chat_id: int, bot) -> None:
@@ -157,8 +209,7 @@ async def handle_audit_result(result: Dict[str, Any], chat_id: int, bot) -> None
             if result.get("reason") == "limit":
                 await bot.send_message(
                     chat_id, 
-                    "Лимит анализов исчерпан. Обратитесь к администратору.",
-                    parse_mode='HTML'
+                    "Лимит анализов исчерпан. Обратитесь к администратору."
                 )
             else:
                 await bot.send_message(chat_id, texts.ERROR_GENERIC, parse_mode='HTML')
@@ -170,9 +221,9 @@ async def handle_audit_result(result: Dict[str, Any], chat_id: int, bot) -> None
         
         if written_now:
             # Результат записан в таблицу пользователя
-            summary_text = texts.RESULT_WITH_SHEET_PREFIX
-            for item in short_summary:
-                summary_text += texts.RESULT_WITH_SHEET_BULLET.format(item=item)
+            summary_text = texts.RESULT_WITH_SHEET_PREFIX + ''.join(
+                texts.RESULT_WITH_SHEET_BULLET.format(item=item) for item in short_summary
+            )
             
             await bot.send_message(
                 chat_id,
@@ -1,27 +1,127 @@
 import sqlite3
 import asyncio
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from pathlib import Path
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
 from loguru import logger
 
 # Путь к базе данных
 DB_PATH = Path("app") / "storage" / "bot.db"
 
+# Настройки соединения: WAL не блокирует чтение во время записи,
+# synchronous=NORMAL в режиме WAL безопасен и не делает fsync на каждый commit
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Размер кэша подготовленных выражений на соединение (по умолчанию в sqlite3 - 128)
+CACHED_STATEMENTS = 256
+
+# Размер пачки при потоковом чтении отложенных результатов
+PENDING_BATCH_SIZE = 100
+
+# Кэш sheet_id пользователей: время жизни записи (секунды) и размер
+SHEET_CACHE_TTL = 300
+SHEET_CACHE_MAX_SIZE = 10_000
+
+# user_id -> (момент истечения, sheet_id); None тоже кэшируется -
+# sheet_id меняется только через set_user_sheet_id, который обновляет кэш
+_sheet_cache: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict()
+
+# Строка лимита пользователя (кортеж вместо словаря на каждый запрос)
+LimitRow = namedtuple("LimitRow", "current max_limit sheet_id")
+
 
 class Database:
     """Класс для работы с SQLite базой данных"""
     
     def __init__(self):
         self.db_path = DB_PATH
+        # Запросы выполняются в потоках executor. Запись идет через одно
+        # соединение под блокировкой, чтение - через соединение потока:
+        # в режиме WAL читатели не ждут писателя и друг друга
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_path: Optional[Path] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
         self._init_db()
     
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        """Открытие соединения с общими настройками"""
+        # Все запросы модуля - постоянные строки, поэтому после первого
+        # выполнения они берутся из кэша выражений без повторного разбора
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+            **kwargs
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def _get_writer(self) -> sqlite3.Connection:
+        """Соединение для записи (вызывается под self._lock)"""
+        # Путь мог смениться (например, в тестах) - переоткрываем соединение
+        if self._writer is None or self._writer_path != self.db_path:
+            if self._writer is not None:
+                self._writer.close()
+            # BEGIN IMMEDIATE: блокировка записи берется в начале транзакции
+            self._writer = self._connect(isolation_level="IMMEDIATE")
+            self._writer_path = self.db_path
+        return self._writer
+    
+    def _get_reader(self) -> sqlite3.Connection:
+        """Соединение для чтения, свое у каждого потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.path != self.db_path:
+            if conn is not None:
+                self._discard_reader(conn)
+            conn = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn, self._local.path = conn, self.db_path
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+    
+    def _discard_reader(self, conn: sqlite3.Connection) -> None:
+        """Закрытие соединения для чтения"""
+        with self._readers_lock:
+            if conn in self._readers:
+                self._readers.remove(conn)
+        conn.close()
+    
+    def close(self) -> None:
+        """Закрытие всех соединений (при остановке бота)"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+                self._writer_path = None
+        
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+        # Потоки executor откроют новые соединения при следующем запросе
+        self._local = threading.local()
+    
     def _init_db(self):
         """Инициализация базы данных и создание таблиц"""
         # Создаем папку если не существует
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock:
+            conn = self._get_writer()
             cursor = conn.cursor()
             
             # Таблица настроек пользователей
@@ -48,29 +148,157 @@ class Database:
                     user_id TEXT NOT NULL,
                     url TEXT NOT NULL,
                     result_json TEXT NOT NULL,
-                    created_at TEXT NOT NULL,
+                    created_at INTEGER NOT NULL,
                     written INTEGER DEFAULT 0
                 )
             """)
             
+            self._migrate_pending_created_at(cursor)
+
+            # Индексы для выборки отложенных результатов пользователя
+            # (в users_settings и users_limits user_id уже PRIMARY KEY).
+            # Частичный индекс содержит только неперенесенные строки и
+            # обслуживает пачечное чтение по id (rowid входит в индекс)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pending_user_written
+                ON pending_results(user_id, written, created_at)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pending_unwritten
+                ON pending_results(user_id) WHERE written = 0
+            """)
+            
+            # Результаты анализа LLM по хэшу контента (переживают перезапуск)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    content_hash TEXT PRIMARY KEY,
+                    full_result_json TEXT NOT NULL,
+                    short_summary_json TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
             conn.commit()
             logger.info("База данных инициализирована")
     
+    @staticmethod
+    def _migrate_pending_created_at(cursor: sqlite3.Cursor) -> None:
+        """
+        Перевод старой таблицы pending_results на created_at INTEGER
+        
+        Раньше created_at был объявлен как TEXT и хранил строку ISO (локальное
+        время). В колонке с affinity TEXT число сохраняется обратно строкой,
+        поэтому таблица пересоздается с колонкой INTEGER: строки ISO переводятся
+        в Unix-время, уже числовые значения только приводятся к INTEGER.
+        
+        Args:
+            cursor: Курсор соединения-писателя
+        """
+        columns = cursor.execute("PRAGMA table_info(pending_results)").fetchall()
+        created_at_type = next((col[2] for col in columns if col[1] == "created_at"), "")
+        if created_at_type.upper() == "INTEGER":
+            return
+        
+        logger.info("Миграция pending_results: created_at TEXT -> INTEGER")
+        cursor.execute("DROP TABLE IF EXISTS pending_results_new")
+        cursor.execute("""
+            CREATE TABLE pending_results_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                result_json TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                written INTEGER DEFAULT 0
+            )
+        """)
+        # Копирование, удаление и переименование - одной транзакцией
+        cursor.execute("""
+            INSERT INTO pending_results_new (id, user_id, url, result_json, created_at, written)
+            SELECT id, user_id, url, result_json,
+                   CASE
+                       WHEN typeof(created_at) = 'text' AND created_at GLOB '*-*'
+                       THEN CAST(strftime('%s', created_at, 'utc') AS INTEGER)
+                       ELSE CAST(created_at AS INTEGER)
+                   END,
+                   written
+            FROM pending_results
+        """)
+        cursor.execute("DROP TABLE pending_results")
+        cursor.execute("ALTER TABLE pending_results_new RENAME TO pending_results")
+    
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
         """Выполнение SELECT запроса"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+        cursor = self._get_reader().execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def execute_scalar(self, query: str, params: tuple = ()) -> Any:
+        """Значение первой колонки первой строки SELECT запроса или None"""
+        row = self._get_reader().execute(query, params).fetchone()
+        return row[0] if row is not None else None
+    
+    def execute_query_one(self, query: str, params: tuple = ()) -> Optional[tuple]:
+        """Первая строка SELECT запроса (без построения словаря) или None"""
+        return self._get_reader().execute(query, params).fetchone()
+    
+    def _execute_write(self, query: str, params: tuple) -> sqlite3.Cursor:
+        """Выполнение изменяющего запроса в отдельной транзакции"""
+        with self._lock:
+            conn = self._get_writer()
+            # Контекст соединения: commit при успехе, rollback при ошибке
+            with conn:
+                return conn.execute(query, params)
     
     def execute_update(self, query: str, params: tuple = ()) -> int:
-        """Выполнение INSERT/UPDATE/DELETE запроса"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            conn.commit()
-            return cursor.lastrowid or cursor.rowcount
+        """Выполнение UPDATE/DELETE запроса. Возвращает число измененных строк"""
+        return self._execute_write(query, params).rowcount
+    
+    def execute_insert(self, query: str, params: tuple = ()) -> int:
+        """Выполнение INSERT запроса. Возвращает rowid добавленной строки"""
+        # lastrowid соединения-писателя не сбрасывается после UPDATE/DELETE,
+        # поэтому он читается только здесь, сразу после INSERT
+        return self._execute_write(query, params).lastrowid
+    
+    def execute_many(self, query: str, params_seq: List[tuple]) -> None:
+        """Выполнение запроса для каждого набора параметров в одной транзакции"""
+        with self._lock:
+            conn = self._get_writer()
+            with conn:
+                conn.executemany(query, params_seq)
+    
+    def begin_audit(self, user_id: str, default_limit: int) -> LimitRow:
+        """
+        Создание лимита, проверка и резервирование анализа в одной транзакции
+        
+        Args:
+            user_id: ID пользователя
+            default_limit: Лимит для нового пользователя
+            
+        Returns:
+            LimitRow (current до резервирования)
+        """
+        with self._lock:
+            conn = self._get_writer()
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO users_limits (user_id, current, max_limit) VALUES (?, 0, ?)",
+                    (user_id, default_limit)
+                )
+                row = LimitRow(*conn.execute(
+                    """
+                    SELECT current, max_limit,
+                           (SELECT sheet_id FROM users_settings WHERE user_id = ?) AS sheet_id
+                    FROM users_limits WHERE user_id = ?
+                    """,
+                    (user_id, user_id)
+                ).fetchone())
+                
+                # Счетчик увеличивается сразу: параллельные анализы не превысят лимит
+                if row.current < row.max_limit:
+                    conn.execute(
+                        "UPDATE users_limits SET current = current + 1 WHERE user_id = ?",
+                        (user_id,)
+                    )
+            return row
 
 
 # Глобальный экземпляр базы данных
@@ -78,23 +306,38 @@ db = Database()
 
 
 # Функции для работы с настройками пользователей
+def _cache_sheet_id(user_id: str, sheet_id: Optional[str]) -> None:
+    """Сохранение sheet_id пользователя в кэш"""
+    _sheet_cache[user_id] = (time.monotonic() + SHEET_CACHE_TTL, sheet_id)
+    _sheet_cache.move_to_end(user_id)
+    
+    # Вытесняем самые старые записи
+    while len(_sheet_cache) > SHEET_CACHE_MAX_SIZE:
+        _sheet_cache.popitem(last=False)
+
+
+def clear_sheet_cache() -> None:
+    """Очистка кэша sheet_id"""
+    _sheet_cache.clear()
+
+
 async def get_user_sheet_id(user_id: str) -> Optional[str]:
     """Получить sheet_id пользователя"""
+    entry = _sheet_cache.get(user_id)
+    if entry is not None and entry[0] > time.monotonic():
+        _sheet_cache.move_to_end(user_id)
+        return entry[1]
+    
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None, 
-            db.execute_query,
+        sheet_id = await asyncio.to_thread(
+            db.execute_scalar,
             "SELECT sheet_id FROM users_settings WHERE user_id = ?",
             (user_id,)
         )
         
-        if result:
-            sheet_id = result[0]['sheet_id']
-            logger.debug(f"Получен sheet_id для {user_id}: {sheet_id}")
-            return sheet_id
-        
-        return None
+        _cache_sheet_id(user_id, sheet_id)
+        logger.debug(f"Получен sheet_id для {user_id}: {sheet_id}")
+        return sheet_id
         
     except Exception as e:
         logger.error(f"Ошибка получения sheet_id для {user_id}: {e}")
@@ -104,13 +347,12 @@ async def get_user_sheet_id(user_id: str) -> Optional[str]:
 async def set_user_sheet_id(user_id: str, sheet_id: str) -> None:
     """Установить sheet_id пользователя"""
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
+        await asyncio.to_thread(
             db.execute_update,
             "INSERT OR REPLACE INTO users_settings (user_id, sheet_id) VALUES (?, ?)",
             (user_id, sheet_id)
         )
+        _cache_sheet_id(user_id, sheet_id)
         
         logger.info(f"Установлен sheet_id для {user_id}: {sheet_id}")
         
@@ -123,9 +365,7 @@ async def set_user_sheet_id(user_id: str, sheet_id: str) -> None:
 async def ensure_user_limit(user_id: str, default_limit: int) -> None:
     """Создать запись лимита если её нет"""
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
+        await asyncio.to_thread(
             db.execute_update,
             "INSERT OR IGNORE INTO users_limits (user_id, current, max_limit) VALUES (?, 0, ?)",
             (user_id, default_limit)
@@ -144,17 +384,14 @@ async def can_run(user_id: str, default_limit: int) -> bool:
         # Убедимся что запись лимита существует
         await ensure_user_limit(user_id, default_limit)
         
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            db.execute_query,
+        row = await asyncio.to_thread(
+            db.execute_query_one,
             "SELECT current, max_limit FROM users_limits WHERE user_id = ?",
             (user_id,)
         )
         
-        if result:
-            current = result[0]['current']
-            max_limit = result[0]['max_limit']
+        if row is not None:
+            current, max_limit = row
             can_execute = current < max_limit
             
             logger.debug(f"Лимит {user_id}: {current}/{max_limit}, можно выполнить: {can_execute}")
@@ -167,12 +404,52 @@ async def can_run(user_id: str, default_limit: int) -> bool:
         return False
 
 
+async def begin_audit(user_id: str, default_limit: int) -> Tuple[bool, Optional[str]]:
+    """
+    Проверка лимита, резервирование анализа и получение sheet_id одним запросом к БД
+    
+    Если анализ разрешен, счетчик уже увеличен; при неудаче анализа
+    резерв нужно вернуть через release_audit.
+    
+    Args:
+        user_id: ID пользователя
+        default_limit: Лимит для нового пользователя
+        
+    Returns:
+        (можно ли запустить анализ, sheet_id или None)
+    """
+    try:
+        row = await asyncio.to_thread(db.begin_audit, user_id, default_limit)
+        
+        _cache_sheet_id(user_id, row.sheet_id)
+        can_execute = row.current < row.max_limit
+        logger.debug(f"Лимит {user_id}: {row.current}/{row.max_limit}, можно выполнить: {can_execute}")
+        return can_execute, row.sheet_id
+        
+    except Exception as e:
+        logger.error(f"Ошибка проверки лимита для {user_id}: {e}")
+        return False, None
+
+
+async def release_audit(user_id: str) -> None:
+    """Вернуть зарезервированный анализ (анализ не завершился)"""
+    try:
+        await asyncio.to_thread(
+            db.execute_update,
+            "UPDATE users_limits SET current = current - 1 WHERE user_id = ? AND current > 0",
+            (user_id,)
+        )
+        
+        logger.debug(f"Резерв анализа для {user_id} возвращен")
+        
+    except Exception as e:
+        logger.error(f"Ошибка возврата резерва анализа для {user_id}: {e}")
+
+
 async def increment_counter(user_id: str) -> None:
     """Увеличить счетчик использования"""
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
+        await asyncio.to_thread(
             db.execute_update,
             "UPDATE users_limits SET current = current + 1 WHERE user_id = ?",
             (user_id,)
@@ -188,13 +465,11 @@ async def increment_counter(user_id: str) -> None:
 async def set_limit(user_id: str, n: int) -> None:
     """Установить лимит пользователя"""
     try:
-        loop = asyncio.get_event_loop()
         # Сначала убеждаемся что запись существует
         await ensure_user_limit(user_id, n)
         
         # Просто обновляем max_limit, сохраняя current
-        await loop.run_in_executor(
-            None,
+        await asyncio.to_thread(
             db.execute_update,
             "UPDATE users_limits SET max_limit = ? WHERE user_id = ?",
             (n, user_id)
@@ -211,11 +486,10 @@ async def set_limit(user_id: str, n: int) -> None:
 async def save_pending_result(user_id: str, url: str, result_json: str) -> int:
     """Сохранить отложенный результат"""
     try:
-        created_at = datetime.now().isoformat()
-        loop = asyncio.get_event_loop()
-        result_id = await loop.run_in_executor(
-            None,
-            db.execute_update,
+        # Unix-время: целое число дешевле строки и в индексе, и при сортировке
+        created_at = int(time.time())
+        result_id = await asyncio.to_thread(
+            db.execute_insert,
             "INSERT INTO pending_results (user_id, url, result_json, created_at) VALUES (?, ?, ?, ?)",
             (user_id, url, result_json, created_at)
         )
@@ -231,11 +505,9 @@ async def save_pending_result(user_id: str, url: str, result_json: str) -> int:
 async def fetch_unwritten_results(user_id: str) -> List[Dict[str, Any]]:
     """Получить неперенесенные результаты пользователя"""
     try:
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(
-            None,
+        results = await asyncio.to_thread(
             db.execute_query,
-            "SELECT * FROM pending_results WHERE user_id = ? AND written = 0 ORDER BY created_at",
+            "SELECT * FROM pending_results WHERE user_id = ? AND written = 0 ORDER BY created_at, id",
             (user_id,)
         )
         
@@ -247,12 +519,46 @@ async def fetch_unwritten_results(user_id: str) -> List[Dict[str, Any]]:
         return []
 
 
+async def iter_unwritten_results(
+    user_id: str,
+    batch_size: int = PENDING_BATCH_SIZE
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Неперенесенные результаты пользователя пачками по batch_size
+    
+    В памяти одновременно находится только одна пачка. Пачки читаются
+    по возрастанию id (порядок сохранения) с продолжением после последнего
+    прочитанного id, поэтому отметка written между пачками не сдвигает выборку.
+    """
+    last_id = 0
+    
+    while True:
+        try:
+            batch = await asyncio.to_thread(
+                db.execute_query,
+                "SELECT * FROM pending_results WHERE user_id = ? AND written = 0 AND id > ? "
+                "ORDER BY id LIMIT ?",
+                (user_id, last_id, batch_size)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка получения отложенных результатов для {user_id}: {e}")
+            return
+        
+        if not batch:
+            return
+        
+        logger.debug(f"Прочитано {len(batch)} отложенных результатов для {user_id}")
+        yield batch
+        
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1]['id']
+
+
 async def mark_written(result_id: int) -> None:
     """Отметить результат как перенесенный"""
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
+        await asyncio.to_thread(
             db.execute_update,
             "UPDATE pending_results SET written = 1 WHERE id = ?",
             (result_id,)
@@ -262,4 +568,83 @@ async def mark_written(result_id: int) -> None:
         
     except Exception as e:
         logger.error(f"Ошибка отметки результата {result_id}: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+async def mark_written_many(result_ids: List[int]) -> None:
+    """Отметить несколько результатов как перенесенные одной транзакцией"""
+    if not result_ids:
+        return
+    
+    try:
+        # Одна транзакция на все ID: один commit вместо commit на каждую строку
+        await asyncio.to_thread(
+            db.execute_many,
+            "UPDATE pending_results SET written = 1 WHERE id = ?",
+            [(result_id,) for result_id in result_ids]
+        )
+        
+        logger.debug(f"{len(result_ids)} результатов отмечены как перенесенные")
+        
+    except Exception as e:
+        logger.error(f"Ошибка отметки результатов {result_ids}: {e}")
+        raise
+
+
+# Функции для работы с кэшем анализа
+async def get_llm_cache(content_hash: str, max_age: float) -> Optional[Tuple[str, str]]:
+    """
+    Получить сохраненный результат анализа
+    
+    Args:
+        content_hash: Хэш контента страниц
+        max_age: Максимальный возраст записи (секунды)
+        
+    Returns:
+        (JSON результата, JSON краткой сводки) или None если записи нет или она устарела
+    """
+    try:
+        row = await asyncio.to_thread(
+            db.execute_query_one,
+            "SELECT full_result_json, short_summary_json FROM llm_cache "
+            "WHERE content_hash = ? AND created_at >= ?",
+            (content_hash, time.time() - max_age)
+        )
+        
+        return tuple(row) if row is not None else None
+        
+    except Exception as e:
+        logger.error(f"Ошибка чтения кэша анализа {content_hash}: {e}")
+        return None
+
+
+async def save_llm_cache(content_hash: str, full_result_json: str, short_summary_json: str) -> None:
+    """Сохранить результат анализа"""
+    try:
+        await asyncio.to_thread(
+            db.execute_update,
+            "INSERT OR REPLACE INTO llm_cache "
+            "(content_hash, full_result_json, short_summary_json, created_at) VALUES (?, ?, ?, ?)",
+            (content_hash, full_result_json, short_summary_json, time.time())
+        )
+        
+        logger.debug(f"Результат анализа {content_hash} сохранен в БД")
+        
+    except Exception as e:
+        # Кэш не обязателен: ошибка записи не должна ломать анализ
+        logger.error(f"Ошибка сохранения кэша анализа {content_hash}: {e}")
+
+
+async def purge_llm_cache(max_age: float) -> None:
+    """Удалить устаревшие результаты анализа"""
+    try:
+        await asyncio.to_thread(
+            db.execute_update,
+            "DELETE FROM llm_cache WHERE created_at < ?",
+            (time.time() - max_age,)
+        )
+        
+        logger.info("Устаревшие результаты анализа удалены")
+        
+    except Exception as e:
+        logger.error(f"Ошибка очистки кэша анализа: {e}")
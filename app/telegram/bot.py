@@ -1,6 +1,7 @@
 import asyncio
-import fcntl
 import os
+import signal
+from typing import Optional
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -15,6 +16,12 @@ from loguru import logger
 
 from app.core.settings import settings
 from app.core.logging import setup_logging
+from app.features.audit.adapters.fetcher import close_http_client
+from app.features.audit.adapters.llm import close_openai_client
+from app.features.audit.adapters.llm_cache import LLM_CACHE_TTL
+from app.storage.sqlite import db, purge_llm_cache
+from app.telegram.update_processor import PerChatUpdateProcessor
+from app.telegram.rate_limiter import TokenBucketRateLimiter
 from app.telegram.handlers import (
     start_command,
     button_callback_handler,
@@ -32,41 +39,106 @@ LOCK_FILE = "/tmp/marketgaze_bot.lock"
 
 
 class BotLock:
-    """Файловый lock для предотвращения множественных запусков"""
+    """Файловый lock для предотвращения множественных запусков
+    
+    PID записывается во временный файл, который затем атомарно связывается
+    с путем lock (os.link не перезаписывает существующий файл), поэтому lock
+    никогда не бывает пустым. Файл, оставшийся от завершившегося процесса,
+    удаляется при запуске.
+    """
     
     def __init__(self, lock_file: str):
         self.lock_file = lock_file
-        self.lock_fd = None
+        self.acquired = False
+    
+    def _read_pid(self) -> Optional[int]:
+        """PID из файла lock или None если файл не читается"""
+        try:
+            with open(self.lock_file) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+    
+    def _remove_stale(self) -> bool:
+        """Удалить lock завершившегося процесса. Возвращает True если удален"""
+        pid = self._read_pid()
+        if pid is None:
+            # Lock без PID не считаем устаревшим: удалив его, можно запустить
+            # второй экземпляр рядом с живым
+            logger.warning(f"Не удалось прочитать PID из {self.lock_file}, считаем lock занятым")
+            return False
+        
+        try:
+            os.kill(pid, 0)
+            return False  # Процесс жив
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            return False  # Процесс жив, но принадлежит другому пользователю
+        
+        logger.warning(f"Удаляю устаревший lock файл (PID {pid})")
+        try:
+            os.unlink(self.lock_file)
+        except FileNotFoundError:
+            pass
+        return True
     
     def acquire(self) -> bool:
         """Захватить lock. Возвращает True если успешно"""
+        tmp_file = f"{self.lock_file}.{os.getpid()}"
         try:
-            self.lock_fd = open(self.lock_file, 'w')
-            fcntl.flock(self.lock_fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-            self.lock_fd.write(str(os.getpid()))
-            self.lock_fd.flush()
-            return True
-        except (IOError, OSError):
-            if self.lock_fd:
-                self.lock_fd.close()
+            with open(tmp_file, 'w') as f:
+                f.write(str(os.getpid()))
+            
+            # Вторая попытка - после удаления устаревшего lock
+            for attempt in range(2):
+                try:
+                    os.link(tmp_file, self.lock_file)
+                except FileExistsError:
+                    if attempt == 0 and self._remove_stale():
+                        continue
+                    return False
+                
+                self.acquired = True
+                return True
+            
+            return False
+        
+        except OSError as e:
+            logger.error(f"Ошибка создания lock файла: {e}")
             return False
+        
+        finally:
+            try:
+                os.unlink(tmp_file)
+            except OSError:
+                pass
     
     def release(self):
         """Освободить lock"""
-        if self.lock_fd:
+        # Удаляем только свой файл: после удаления устаревшего lock
+        # его мог уже создать другой экземпляр
+        if self.acquired and self._read_pid() == os.getpid():
             try:
-                fcntl.flock(self.lock_fd.fileno(), fcntl.LOCK_UN)
-                self.lock_fd.close()
                 os.unlink(self.lock_file)
-            except (IOError, OSError):
+            except OSError:
                 pass
+        self.acquired = False
 
 
 def create_application() -> Application:
     """Создание и настройка Telegram Application"""
     
     # Создаем приложение
-    application = Application.builder().token(settings.telegram_token).build()
+    # Обновления разных чатов обрабатываются параллельно, одного чата - по очереди;
+    # исходящие сообщения ограничены лимитом Telegram (30 в секунду)
+    application = (
+        Application.builder()
+        .token(settings.telegram_token)
+        .concurrent_updates(PerChatUpdateProcessor())
+        .rate_limiter(TokenBucketRateLimiter())
+        .build()
+    )
     
     # Обработчик команды /start
     application.add_handler(CommandHandler("start", start_command))
@@ -122,6 +194,9 @@ async def main():
         
         logger.info("Lock захвачен, продолжаем запуск")
         
+        # Удаляем устаревшие результаты анализа (при чтении они и так пропускаются)
+        await purge_llm_cache(LLM_CACHE_TTL)
+        
         # Создаем приложение
         application = create_application()
         
@@ -145,10 +220,19 @@ async def main():
         
         logger.info("Бот запущен в режиме polling")
         
-        # Держим бота запущенным
+        # Держим бота запущенным до SIGINT/SIGTERM без периодических пробуждений
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                # Windows: остается стандартная обработка Ctrl+C
+                pass
+        
         try:
-            while True:
-                await asyncio.sleep(1)
+            await stop_event.wait()
+            logger.info("Получен сигнал остановки")
         except KeyboardInterrupt:
             logger.info("Получен сигнал остановки")
         
@@ -157,6 +241,11 @@ async def main():
         await application.stop()
         await application.shutdown()
         
+        # Закрываем общие HTTP клиенты загрузчика и OpenAI и соединение с БД
+        await close_http_client()
+        await close_openai_client()
+        db.close()
+        
     except Conflict as e:
         logger.error("Обнаружен другой экземпляр бота (или активный webhook). Завершение.")
         exit(1)
@@ -168,6 +257,9 @@ async def main():
         if bot_lock:
             bot_lock.release()
             logger.info("Lock освобожден")
+        
+        # Дожидаемся записи логов из фоновой очереди
+        await logger.complete()
 
 
 if __name__ == "__main__":
@@ -13,6 +13,10 @@ from app.telegram import texts, keyboards
 # Состояния для ConversationHandler
 WAITING_FOR_URL, WAITING_FOR_SHEET_URL = range(2)
 
+# ID из Google Sheets URL: путь /spreadsheets/d/<id> или параметр id=<id>,
+# оба варианта ищутся за один проход по строке
+_SHEET_ID_RE = re.compile(r"(?:/spreadsheets/d/|[?&]id=)([a-zA-Z0-9_-]+)")
+
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработчик команды /start"""
@@ -46,65 +50,93 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         return ConversationHandler.END
 
 
-async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Обработчик нажатий на inline кнопки"""
+async def _do_start_analysis(query, user_id: str, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Кнопки 'Начать анализ' / 'Новый анализ': запрос ссылки на сайт"""
     try:
-        query = update.callback_query
         await query.answer()
+        logger.debug(f"Переходим в состояние WAITING_FOR_URL для {user_id}")
+        await query.edit_message_text(texts.ASK_FOR_URL, parse_mode='HTML')
+        return WAITING_FOR_URL
         
-        user_id = str(query.from_user.id)
-        data = query.data
-        
-        logger.info(f"Callback {data} от пользователя {user_id}")
-        
-        if data == "start_analysis" or data == "new_analysis":
-            # Начать новый анализ
-            logger.debug(f"Переходим в состояние WAITING_FOR_URL для {user_id}")
-            await query.edit_message_text(texts.ASK_FOR_URL, parse_mode='HTML')
-            return WAITING_FOR_URL
-            
-        elif data == "connect_sheet":
-            # Подключить таблицу
-            logger.debug(f"Переходим в состояние WAITING_FOR_SHEET_URL для {user_id}")
-            try:
-                service_email = await get_service_email()
-                instructions = texts.CONNECT_INSTRUCTIONS.format(service_email=service_email)
-                await query.edit_message_text(instructions, parse_mode='HTML')
-                return WAITING_FOR_SHEET_URL
-            except Exception as e:
-                logger.error(f"Ошибка получения service_email: {e}")
-                await query.edit_message_text(texts.ERROR_GENERIC, parse_mode='HTML')
-                return ConversationHandler.END
-                
-        elif data == "open_sheet":
-            # Открыть таблицу
-            sheet_id = await get_user_sheet_id(user_id)
-            if sheet_id:
-                sheet_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}"
-                await query.edit_message_text(
-                    f"Твоя таблица: {sheet_url}",
-                    reply_markup=keyboards.main_kb(),
-                    parse_mode='HTML'
-                )
-            else:
-                # Открыть резервную таблицу
-                default_sheet_url = f"https://docs.google.com/spreadsheets/d/{settings.google_sheets_id}"
-                await query.edit_message_text(
-                    f"Резервная таблица: {default_sheet_url}",
-                    reply_markup=keyboards.main_kb(),
-                    parse_mode='HTML'
-                )
-            return ConversationHandler.END
+    except Exception as e:
+        logger.error(f"Ошибка в _do_start_analysis: {e}")
+        await query.edit_message_text(texts.ERROR_GENERIC, parse_mode='HTML')
+        return ConversationHandler.END
+
+
+async def _do_connect_sheet(query, user_id: str, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Кнопка 'Подключить таблицу': инструкция и ожидание ссылки на таблицу"""
+    try:
+        await query.answer()
+        logger.debug(f"Переходим в состояние WAITING_FOR_SHEET_URL для {user_id}")
+        service_email = await get_service_email()
+        instructions = texts.CONNECT_INSTRUCTIONS.format(service_email=service_email)
+        await query.edit_message_text(instructions, parse_mode='HTML')
+        return WAITING_FOR_SHEET_URL
         
-        logger.debug(f"Завершаем диалог для {user_id}")
+    except Exception as e:
+        logger.error(f"Ошибка получения service_email: {e}")
+        await query.edit_message_text(texts.ERROR_GENERIC, parse_mode='HTML')
+        return ConversationHandler.END
+
+
+async def _do_open_sheet(query, user_id: str, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Кнопка 'Открыть таблицу': ссылка на таблицу пользователя или резервную"""
+    # Ссылка отправляется простым текстом (без parse_mode) и без превью:
+    # Telegram не разбирает разметку и не загружает страницу таблицы
+    try:
+        await query.answer()
+        sheet_id = await get_user_sheet_id(user_id)
+        if sheet_id:
+            sheet_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}"
+            await query.edit_message_text(
+                f"Твоя таблица: {sheet_url}",
+                reply_markup=keyboards.main_kb(),
+                disable_web_page_preview=True
+            )
+        else:
+            # Открыть резервную таблицу
+            default_sheet_url = f"https://docs.google.com/spreadsheets/d/{settings.google_sheets_id}"
+            await query.edit_message_text(
+                f"Резервная таблица: {default_sheet_url}",
+                reply_markup=keyboards.main_kb(),
+                disable_web_page_preview=True
+            )
         return ConversationHandler.END
         
     except Exception as e:
-        logger.error(f"Ошибка в button_callback_handler: {e}")
+        logger.error(f"Ошибка в _do_open_sheet: {e}")
         await query.edit_message_text(texts.ERROR_GENERIC, parse_mode='HTML')
         return ConversationHandler.END
 
 
+# Обработчики inline кнопок по callback_data
+_CALLBACK_DISPATCH = {
+    "start_analysis": _do_start_analysis,
+    "new_analysis": _do_start_analysis,
+    "connect_sheet": _do_connect_sheet,
+    "open_sheet": _do_open_sheet,
+}
+
+
+async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Обработчик нажатий на inline кнопки"""
+    query = update.callback_query
+    user_id = str(query.from_user.id)
+    data = query.data
+    
+    logger.info(f"Callback {data} от пользователя {user_id}")
+    
+    # На устаревшие кнопки с неизвестными данными query.answer() не вызывается,
+    # лишний запрос к Telegram не отправляется
+    handler = _CALLBACK_DISPATCH.get(data)
+    if handler is None:
+        logger.debug(f"Неизвестный callback {data}, завершаем диалог для {user_id}")
+        return ConversationHandler.END
+    
+    return await handler(query, user_id, context)
+
+
 async def url_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обработчик URL для анализа"""
     try:
@@ -143,23 +175,18 @@ async def sheet_url_message_handler(update: Update, context: ContextTypes.DEFAUL
         sheet_id = extract_sheet_id(sheet_url)
         if not sheet_id:
             await update.message.reply_text(
-                "Неверный формат ссылки на Google Таблицу. Попробуйте еще раз.",
-                parse_mode='HTML'
+                "Неверный формат ссылки на Google Таблицу. Попробуйте еще раз."
             )
             return WAITING_FOR_SHEET_URL
         
-        # Сохраняем sheet_id в БД
+        # Сохраняем sheet_id в БД (до ответа: новые анализы сразу пишутся в таблицу)
         await set_user_sheet_id(user_id, sheet_id)
         
-        # Переносим отложенные результаты
-        count = await flush_pending_to_user_sheet(user_id)
+        await update.message.reply_text(texts.SHEET_CONNECTED_FLUSHING, parse_mode='HTML')
         
-        # Отправляем подтверждение
-        message = texts.CONNECTED_AND_FLUSHED.format(count=count)
-        await update.message.reply_text(
-            message,
-            reply_markup=keyboards.after_result_with_sheet_kb(),
-            parse_mode='HTML'
+        # Переносим отложенные результаты в фоне, итог придет отдельным сообщением
+        context.application.create_task(
+            _flush_and_notify(user_id, update.effective_chat.id, context.bot)
         )
         
         return ConversationHandler.END
@@ -170,25 +197,37 @@ async def sheet_url_message_handler(update: Update, context: ContextTypes.DEFAUL
         return ConversationHandler.END
 
 
-def extract_sheet_id(url: str) -> str:
-    """Извлечение sheet_id из URL Google Sheets"""
+async def _flush_and_notify(user_id: str, chat_id: int, bot) -> None:
+    """
+    Перенос отложенных результатов и отправка итога пользователю
+    
+    Args:
+        user_id: ID пользователя
+        chat_id: ID чата для отправки результата
+        bot: Экземпляр Telegram бота
+    """
     try:
-        # Паттерн для извлечения ID из Google Sheets URL
-        patterns = [
-            r"/spreadsheets/d/([a-zA-Z0-9-_]+)",
-            r"id=([a-zA-Z0-9-_]+)",
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
+        count = await flush_pending_to_user_sheet(user_id)
         
-        return ""
+        await bot.send_message(
+            chat_id,
+            texts.CONNECTED_AND_FLUSHED.format(count=count),
+            reply_markup=keyboards.after_result_with_sheet_kb(),
+            parse_mode='HTML'
+        )
         
     except Exception as e:
-        logger.error(f"Ошибка извлечения sheet_id из URL {url}: {e}")
-        return ""
+        logger.error(f"Ошибка переноса результатов для {user_id}: {e}")
+        try:
+            await bot.send_message(chat_id, texts.ERROR_GENERIC, parse_mode='HTML')
+        except Exception as send_error:
+            logger.error(f"Не удалось отправить сообщение об ошибке: {send_error}")
+
+
+def extract_sheet_id(url: str) -> str:
+    """Извлечение sheet_id из URL Google Sheets"""
+    match = _SHEET_ID_RE.search(url)
+    return match.group(1) if match else ""
 
 
 async def set_limit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -205,8 +244,7 @@ async def set_limit_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if not context.args or len(context.args) != 2:
             await update.message.reply_text(
                 "Использование: /set_limit <user_id> <лимит>\n"
-                "Пример: /set_limit 123456789 50",
-                parse_mode='HTML'
+                "Пример: /set_limit 123456789 50"
             )
             return ConversationHandler.END
         
@@ -214,19 +252,18 @@ async def set_limit_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             target_user_id = context.args[0]
             new_limit = int(context.args[1])
         except ValueError:
-            await update.message.reply_text("Лимит должен быть числом.", parse_mode='HTML')
+            await update.message.reply_text("Лимит должен быть числом.")
             return ConversationHandler.END
         
         if new_limit < 0:
-            await update.message.reply_text("Лимит не может быть отрицательным.", parse_mode='HTML')
+            await update.message.reply_text("Лимит не может быть отрицательным.")
             return ConversationHandler.END
         
         # Устанавливаем лимит
         await set_limit(target_user_id, new_limit)
         
         await update.message.reply_text(
-            f"Лимит для пользователя {target_user_id} установлен: {new_limit}",
-            parse_mode='HTML'
+            f"Лимит для пользователя {target_user_id} установлен: {new_limit}"
         )
         
         logger.info(f"Админ {admin_user_id} установил лимит {new_limit} для пользователя {target_user_id}")
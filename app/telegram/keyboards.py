@@ -1,40 +1,46 @@
 # Клавиатуры для Telegram бота
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+# Клавиатуры строятся один раз при импорте: объекты PTB неизменяемы,
+# поэтому один экземпляр можно отправлять в любом количестве сообщений
+_SINGLE_START_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Начать анализ", callback_data="start_analysis")]
+])
+
+_MAIN_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔍 Новый анализ", callback_data="new_analysis")],
+    [
+        InlineKeyboardButton("📊 Подключить таблицу", callback_data="connect_sheet"),
+        InlineKeyboardButton("📂 Открыть таблицу", callback_data="open_sheet")
+    ]
+])
+
+_AFTER_RESULT_NO_SHEET_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📊 Подключить таблицу", callback_data="connect_sheet")],
+    [InlineKeyboardButton("🔍 Новый анализ", callback_data="new_analysis")]
+])
+
+_AFTER_RESULT_WITH_SHEET_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📂 Открыть таблицу", callback_data="open_sheet")],
+    [InlineKeyboardButton("🔍 Новый анализ", callback_data="new_analysis")]
+])
+
 
 def single_start_kb() -> InlineKeyboardMarkup:
     """Клавиатура с одной кнопкой 'Начать анализ'"""
-    keyboard = [
-        [InlineKeyboardButton("🚀 Начать анализ", callback_data="start_analysis")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return _SINGLE_START_KB
 
 
 def main_kb() -> InlineKeyboardMarkup:
     """Основная клавиатура с кнопками управления"""
-    keyboard = [
-        [InlineKeyboardButton("🔍 Новый анализ", callback_data="new_analysis")],
-        [
-            InlineKeyboardButton("📊 Подключить таблицу", callback_data="connect_sheet"),
-            InlineKeyboardButton("📂 Открыть таблицу", callback_data="open_sheet")
-        ]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return _MAIN_KB
 
 
 def after_result_no_sheet_kb() -> InlineKeyboardMarkup:
     """Клавиатура после анализа без подключенной таблицы"""
-    keyboard = [
-        [InlineKeyboardButton("📊 Подключить таблицу", callback_data="connect_sheet")],
-        [InlineKeyboardButton("🔍 Новый анализ", callback_data="new_analysis")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return _AFTER_RESULT_NO_SHEET_KB
 
 
 def after_result_with_sheet_kb() -> InlineKeyboardMarkup:
     """Клавиатура после анализа с подключенной таблицей"""
-    keyboard = [
-        [InlineKeyboardButton("📂 Открыть таблицу", callback_data="open_sheet")],
-        [InlineKeyboardButton("🔍 Новый анализ", callback_data="new_analysis")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
+    return _AFTER_RESULT_WITH_SHEET_KB
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from loguru import logger
+
+# Общий лимит Telegram на отправку сообщений ботом (сообщений в секунду)
+MESSAGES_PER_SECOND = 30
+
+# Сколько раз повторять запрос после ответа RetryAfter
+MAX_RETRIES = 1
+
+Result = Union[bool, Dict[str, Any], List[Dict[str, Any]]]
+
+
+class TokenBucketRateLimiter(BaseRateLimiter[int]):
+    """Ограничение частоты запросов бота к Telegram (token bucket)
+
+    Ограничиваются только запросы с chat_id (отправка и редактирование
+    сообщений); getUpdates и служебные запросы проходят без ожидания.
+    После RetryAfter все запросы ждут указанное Telegram время.
+    """
+
+    def __init__(
+        self,
+        rate: float = MESSAGES_PER_SECOND,
+        burst: int = MESSAGES_PER_SECOND,
+        max_retries: int = MAX_RETRIES
+    ):
+        self._rate = rate
+        self._burst = burst
+        self._max_retries = max_retries
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        # Сброшено, пока действует RetryAfter
+        self._retry_after_event = asyncio.Event()
+        self._retry_after_event.set()
+
+    async def initialize(self) -> None:
+        """Ресурсы создаются в конструкторе"""
+
+    async def shutdown(self) -> None:
+        """Освобождение ресурсов не требуется"""
+
+    async def _acquire_token(self) -> None:
+        """Ожидание свободного токена"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    async def _run(
+        self,
+        limited: bool,
+        callback: Callable[..., Coroutine[Any, Any, Result]],
+        args: Any,
+        kwargs: Dict[str, Any],
+    ) -> Result:
+        """Выполнение запроса после снятия RetryAfter и получения токена"""
+        await self._retry_after_event.wait()
+        if limited:
+            await self._acquire_token()
+        return await callback(*args, **kwargs)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Result]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Result:
+        """Выполнение запроса к Bot API с учетом лимита"""
+        max_retries = rate_limit_args if rate_limit_args is not None else self._max_retries
+        limited = data.get("chat_id") is not None
+
+        for _ in range(max_retries):
+            try:
+                return await self._run(limited, callback, args, kwargs)
+            except RetryAfter as e:
+                logger.warning(f"Лимит Telegram для {endpoint}, ждем {e.retry_after} с")
+                # Останавливаем все запросы, пока действует ограничение
+                self._retry_after_event.clear()
+                try:
+                    await asyncio.sleep(e.retry_after)
+                finally:
+                    self._retry_after_event.set()
+
+        # Последняя попытка: RetryAfter передается вызывающему коду
+        return await self._run(limited, callback, args, kwargs)
@@ -40,6 +40,8 @@ CONNECT_INSTRUCTIONS = (
     "🔄 <i>Все сохраненные результаты перенесутся автоматически</i>"
 )
 
+SHEET_CONNECTED_FLUSHING = "🔄 <b>Таблица подключена</b>, переношу сохраненные результаты…"
+
 CONNECTED_AND_FLUSHED = "🎉 <b>Подключено!</b> Перенес {count} результат(а/ов) в таблицу"
 
 # Ошибки
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# Максимум обработчиков, выполняющихся одновременно (по всем чатам)
+MAX_CONCURRENT_UPDATES = 64
+
+# Лимит PTB на обновления в работе, включая ждущие очереди своего чата
+MAX_QUEUED_UPDATES = 10_000
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Обработка обновлений разных чатов параллельно, одного чата - по очереди
+
+    ConversationHandler требует последовательной обработки обновлений одного
+    диалога, поэтому общий concurrent_updates=True использовать нельзя. Здесь
+    обновления одного чата ждут друг друга, а медленный обработчик в одном
+    чате не задерживает остальных пользователей.
+
+    Семафор PTB берется до do_process_update, поэтому он задан с большим
+    запасом (max_queued_updates), а число одновременно работающих
+    обработчиков ограничивает свой семафор, который берется только после
+    блокировки чата: обновления в очереди чата не занимают общих слотов.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int = MAX_CONCURRENT_UPDATES,
+        max_queued_updates: int = MAX_QUEUED_UPDATES
+    ):
+        super().__init__(max(max_queued_updates, max_concurrent_updates))
+        self._handlers_semaphore = asyncio.Semaphore(max_concurrent_updates)
+        # chat_id -> (блокировка чата, количество ожидающих и выполняющихся обновлений)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._chat_users: Dict[int, int] = {}
+
+    @staticmethod
+    def _chat_id(update: object) -> Optional[int]:
+        """ID чата обновления или None если чата нет"""
+        if isinstance(update, Update) and update.effective_chat:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Выполнение обработчика под блокировкой чата"""
+        chat_id = self._chat_id(update)
+        if chat_id is None:
+            async with self._handlers_semaphore:
+                await coroutine
+            return
+
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        self._chat_users[chat_id] = self._chat_users.get(chat_id, 0) + 1
+
+        try:
+            async with lock, self._handlers_semaphore:
+                await coroutine
+        finally:
+            # Блокировку чата без обновлений удаляем, чтобы словарь не рос
+            self._chat_users[chat_id] -= 1
+            if not self._chat_users[chat_id]:
+                del self._chat_users[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def initialize(self) -> None:
+        """Ресурсы создаются по мере необходимости"""
+
+    async def shutdown(self) -> None:
+        """Освобождение ресурсов не требуется"""
@@ -13,8 +13,8 @@ pkill -f "app.telegram.bot" 2>/dev/null || echo "   ℹ️  Процессы б
 # Ждем завершения процессов
 sleep 2
 
-echo "🗑️  Удаляем файл блокировки..."
-rm -f /tmp/marketgaze_bot.lock
+# Файл блокировки не удаляем: lock завершившегося процесса бот
+# распознает и удаляет сам при запуске
 
 echo "🚀 Запускаем бота с логами в терминале..."
 echo "   (для остановки нажмите Ctrl+C)"
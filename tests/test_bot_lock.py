@@ -0,0 +1,60 @@
+# Тесты для защиты от множественных запусков
+
+import os
+import pytest
+from app.telegram.bot import BotLock
+
+
+class TestBotLock:
+    """Тесты для файлового lock бота"""
+
+    @pytest.fixture
+    def lock_file(self, tmp_path):
+        """Путь к lock файлу во временной папке"""
+        return str(tmp_path / "bot.lock")
+
+    def test_second_instance_rejected(self, lock_file):
+        """Пока lock захвачен, второй экземпляр не запускается"""
+        first = BotLock(lock_file)
+        assert first.acquire() is True
+        assert BotLock(lock_file).acquire() is False
+
+        first.release()
+        assert not os.path.exists(lock_file)
+        assert BotLock(lock_file).acquire() is True
+
+    def test_stale_lock_removed(self, lock_file):
+        """Lock завершившегося процесса удаляется и захватывается заново"""
+        with open(lock_file, "w") as f:
+            f.write("999999999")
+
+        lock = BotLock(lock_file)
+        assert lock.acquire() is True
+        with open(lock_file) as f:
+            assert f.read() == str(os.getpid())
+
+    def test_lock_without_pid_kept(self, lock_file):
+        """Lock без PID (запись еще не завершена) считается занятым"""
+        open(lock_file, "w").close()
+
+        assert BotLock(lock_file).acquire() is False
+        assert os.path.exists(lock_file)
+
+    def test_no_temp_files_left(self, lock_file, tmp_path):
+        """После захвата остается только сам lock файл"""
+        lock = BotLock(lock_file)
+        assert lock.acquire() is True
+        assert BotLock(lock_file).acquire() is False
+        assert os.listdir(tmp_path) == ["bot.lock"]
+
+    def test_release_keeps_foreign_lock(self, lock_file):
+        """release не удаляет lock, созданный другим процессом"""
+        lock = BotLock(lock_file)
+        assert lock.acquire() is True
+
+        # Файл перехватил другой экземпляр
+        with open(lock_file, "w") as f:
+            f.write("1")
+
+        lock.release()
+        assert os.path.exists(lock_file)
@@ -64,6 +64,10 @@ class TestHtmlCleaner:
         assert clean_html("   ") == ""
         assert clean_html(None) == ""
     
+    def test_clean_html_plain_text(self):
+        """Текст без тегов обрабатывается без парсера"""
+        assert clean_html("  Просто   текст\n без тегов  ") == "Просто текст без тегов"
+    
     def test_extract_visible_text(self):
         """Извлечение только видимого текста"""
         html = """
@@ -99,6 +103,11 @@ class TestHtmlCleaner:
         assert "права защищены" not in result
         assert "Cookie" not in result
     
+    def test_remove_navigation_noise_overlapping_patterns(self):
+        """Пересекающиеся паттерны удаляются по очереди, в порядке списка"""
+        text = "cookie © 2020 мы согласие права защищены"
+        assert remove_navigation_noise(text) == "cookie"
+    
     def test_clean_html_malformed(self):
         """Обработка некорректного HTML"""
         html = "<div><p>Текст<unclosed><script>bad</script>Еще текст"
@@ -34,17 +34,14 @@ class TestE2EWorkflow:
         # Исправляем пути для моков - указываем где функции импортируются, а не где определены
         with patch('app.features.audit.services.run_audit.get_content_bundle', new_callable=AsyncMock) as mock_get_content, \
              patch('app.features.audit.services.run_audit.analyze_content', new_callable=AsyncMock) as mock_analyze, \
-             patch('app.features.audit.services.run_audit.get_user_sheet_id', new_callable=AsyncMock) as mock_get_sheet, \
-             patch('app.features.audit.services.run_audit.ensure_user_limit', new_callable=AsyncMock), \
-             patch('app.features.audit.services.run_audit.can_run', new_callable=AsyncMock) as mock_can_run, \
-             patch('app.features.audit.services.run_audit.increment_counter', new_callable=AsyncMock), \
+             patch('app.features.audit.services.run_audit.begin_audit', new_callable=AsyncMock) as mock_begin, \
+             patch('app.features.audit.services.run_audit.release_audit', new_callable=AsyncMock), \
              patch('app.features.audit.services.run_audit.write_or_defer', new_callable=AsyncMock) as mock_write:
             
             # Настройка моков
             mock_get_content.return_value = mock_bundle
             mock_analyze.return_value = (mock_full_result, mock_short_summary)
-            mock_get_sheet.return_value = None  # Таблица не подключена
-            mock_can_run.return_value = True
+            mock_begin.return_value = (True, None)  # Таблица не подключена
             
             # Выполняем анализ
             result = await run_audit(user_id, url)
@@ -67,10 +64,8 @@ class TestE2EWorkflow:
         
         with patch('app.features.audit.services.run_audit.get_content_bundle', new_callable=AsyncMock) as mock_get_content, \
              patch('app.features.audit.services.run_audit.analyze_content', new_callable=AsyncMock) as mock_analyze, \
-             patch('app.features.audit.services.run_audit.get_user_sheet_id', new_callable=AsyncMock) as mock_get_sheet, \
-             patch('app.features.audit.services.run_audit.ensure_user_limit', new_callable=AsyncMock), \
-             patch('app.features.audit.services.run_audit.can_run', new_callable=AsyncMock) as mock_can_run, \
-             patch('app.features.audit.services.run_audit.increment_counter', new_callable=AsyncMock), \
+             patch('app.features.audit.services.run_audit.begin_audit', new_callable=AsyncMock) as mock_begin, \
+             patch('app.features.audit.services.run_audit.release_audit', new_callable=AsyncMock), \
              patch('app.features.audit.services.run_audit.write_or_defer', new_callable=AsyncMock) as mock_write:
             
             # Настройка моков
@@ -85,8 +80,7 @@ class TestE2EWorkflow:
             
             mock_get_content.return_value = mock_bundle
             mock_analyze.return_value = (mock_full_result, mock_short_summary)
-            mock_get_sheet.return_value = "test_sheet_123"  # Таблица подключена
-            mock_can_run.return_value = True
+            mock_begin.return_value = (True, "test_sheet_123")  # Таблица подключена
             
             # Выполняем анализ
             result = await run_audit(user_id, url)
@@ -99,17 +93,47 @@ class TestE2EWorkflow:
             # Проверяем что write_or_defer вызван
             mock_write.assert_called_once()
     
+    @pytest.mark.asyncio
+    async def test_concurrent_audits_of_same_url_share_analysis(self):
+        """Одновременные анализы одного URL выполняют загрузку и LLM один раз"""
+        url = "https://example.com"
+        
+        async def slow_bundle(_url):
+            await asyncio.sleep(0.01)
+            return {"home_text": "Контент главной страницы", "pricing_text": None, "pricing_url": None}
+        
+        mock_full_result = Mock()
+        mock_full_result.model_dump.return_value = {"offer_first_screen": "Тестовый оффер"}
+        
+        with patch('app.features.audit.services.run_audit.get_content_bundle', side_effect=slow_bundle) as mock_get_content, \
+             patch('app.features.audit.services.run_audit.analyze_content', new_callable=AsyncMock) as mock_analyze, \
+             patch('app.features.audit.services.run_audit.begin_audit', new_callable=AsyncMock) as mock_begin, \
+             patch('app.features.audit.services.run_audit.release_audit', new_callable=AsyncMock) as mock_release, \
+             patch('app.features.audit.services.run_audit.write_or_defer', new_callable=AsyncMock) as mock_write:
+            
+            mock_analyze.return_value = (mock_full_result, ["Пункт"])
+            mock_begin.return_value = (True, None)
+            
+            results = await asyncio.gather(run_audit("user_a", url), run_audit("user_b", url))
+            
+            assert all(r["ok"] for r in results)
+            assert mock_get_content.call_count == 1
+            assert mock_analyze.call_count == 1
+            # Результат и лимит - у каждого пользователя свои
+            assert mock_write.call_count == 2
+            assert mock_begin.call_count == 2
+            mock_release.assert_not_called()
+    
     @pytest.mark.asyncio
     async def test_audit_limit_exceeded(self):
         """Тест превышения лимита анализов"""
         user_id = "test_limited_user"
         url = "https://example.com"
         
-        with patch('app.features.audit.services.run_audit.ensure_user_limit', new_callable=AsyncMock), \
-             patch('app.features.audit.services.run_audit.can_run', new_callable=AsyncMock) as mock_can_run:
+        with patch('app.features.audit.services.run_audit.begin_audit', new_callable=AsyncMock) as mock_begin:
             
             # Лимит превышен
-            mock_can_run.return_value = False
+            mock_begin.return_value = (False, None)
             
             # Выполняем анализ
             result = await run_audit(user_id, url)
@@ -125,11 +149,11 @@ class TestE2EWorkflow:
         url = "https://invalid-url.com"
         
         with patch('app.features.audit.services.run_audit.get_content_bundle', new_callable=AsyncMock) as mock_get_content, \
-             patch('app.features.audit.services.run_audit.ensure_user_limit', new_callable=AsyncMock), \
-             patch('app.features.audit.services.run_audit.can_run', new_callable=AsyncMock) as mock_can_run:
+             patch('app.features.audit.services.run_audit.begin_audit', new_callable=AsyncMock) as mock_begin, \
+             patch('app.features.audit.services.run_audit.release_audit', new_callable=AsyncMock) as mock_release:
             
             # Настройка моков
-            mock_can_run.return_value = True
+            mock_begin.return_value = (True, None)
             mock_get_content.return_value = {"home_text": ""}  # Пустой контент
             
             # Выполняем анализ
@@ -138,6 +162,9 @@ class TestE2EWorkflow:
             # Проверки
             assert result["ok"] is False
             assert result["reason"] == "fetch_failed"
+            
+            # Зарезервированный анализ возвращается
+            mock_release.assert_called_once_with(user_id)
     
     @pytest.mark.asyncio
     async def test_pending_results_flush(self):
@@ -165,22 +192,27 @@ class TestE2EWorkflow:
         ]
         
         with patch('app.features.audit.services.persist.get_user_sheet_id', new_callable=AsyncMock) as mock_get_sheet, \
-             patch('app.features.audit.services.persist.fetch_unwritten_results', new_callable=AsyncMock) as mock_fetch, \
+             patch('app.features.audit.services.persist.iter_unwritten_results') as mock_iter, \
              patch('app.features.audit.services.persist.ensure_headers', new_callable=AsyncMock), \
-             patch('app.features.audit.services.persist.write_row', new_callable=AsyncMock) as mock_write_row, \
-             patch('app.features.audit.services.persist.mark_written', new_callable=AsyncMock) as mock_mark:
+             patch('app.features.audit.services.persist.write_rows', new_callable=AsyncMock) as mock_write_rows, \
+             patch('app.features.audit.services.persist.mark_written_many', new_callable=AsyncMock) as mock_mark:
             
             # Настройка моков
             mock_get_sheet.return_value = "test_sheet_123"
-            mock_fetch.return_value = mock_pending_results
+            async def batches(user_id):
+                yield mock_pending_results
+            mock_iter.side_effect = batches
             
             # Выполняем перенос
             count = await flush_pending_to_user_sheet(user_id)
             
             # Проверки
             assert count == 2
-            assert mock_write_row.call_count == 2
-            assert mock_mark.call_count == 2
+            # Все строки записываются одним запросом
+            mock_write_rows.assert_called_once()
+            rows = mock_write_rows.call_args.args[1]
+            assert [row[2] for row in rows] == ["https://site1.com", "https://site2.com"]
+            mock_mark.assert_called_once_with([1, 2])
     
     @pytest.mark.asyncio
     async def test_write_or_defer_with_sheet(self):
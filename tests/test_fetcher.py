@@ -0,0 +1,40 @@
+# Тесты для загрузки контента сайта
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from app.features.audit.adapters import fetcher
+
+HOME_HTML = (
+    "<html><body><p>" + "Главная страница с оффером. " * 5 + "</p>"
+    "<a href='/pricing'>Цены</a><a href='/tariffs'>Тарифы</a></body></html>"
+)
+
+
+class TestGetContentBundle:
+    """Тесты для get_content_bundle (HTTP fallback)"""
+
+    @pytest.mark.asyncio
+    async def test_pricing_tasks_cancelled_on_error(self):
+        """При ошибке очистки главной загрузки страниц цен отменяются"""
+        started = []
+        cancelled = []
+
+        async def fake_fetch(url: str) -> str:
+            if not started and url.endswith("example.com"):
+                started.append(url)
+                return HOME_HTML
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+            return ""
+
+        with patch.object(fetcher, "USE_WEB_TOOLS", False), \
+             patch.object(fetcher, "http_fetch", side_effect=fake_fetch), \
+             patch.object(fetcher, "clean_tree", side_effect=RuntimeError("ошибка очистки")):
+            with pytest.raises(RuntimeError):
+                await fetcher.get_content_bundle("https://example.com")
+
+        assert len(cancelled) == 2
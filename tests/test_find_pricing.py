@@ -1,7 +1,8 @@
 # Тесты для поиска ценовой информации
 
 import pytest
-from app.features.audit.adapters.fetcher import find_pricing_link
+from selectolax.lexbor import LexborHTMLParser
+from app.features.audit.adapters.fetcher import find_pricing_link, find_pricing_links_in_tree
 
 
 class TestFindPricing:
@@ -196,4 +197,54 @@ class TestFindPricing:
         html = "<a href='/pricing'>Цены</a><unclosed tag"
         base_url = "https://example.com"
         result = find_pricing_link(html, base_url)
-        assert result == "https://example.com/pricing"
\ No newline at end of file
+        assert result == "https://example.com/pricing"
+    
+    def test_find_pricing_candidates(self):
+        """Кандидаты возвращаются по порядку, без дублей и внешних ссылок, не больше limit"""
+        html = '''
+        <html>
+            <body>
+                <a href="/pricing">Цены</a>
+                <a href="/pricing">Цены еще раз</a>
+                <a href="https://other.com/prices">Чужие цены</a>
+                <a href="/tariffs">Тарифы</a>
+                <a href="/cost">Стоимость</a>
+            </body>
+        </html>
+        '''
+        tree = LexborHTMLParser(html)
+        result = find_pricing_links_in_tree(tree, "https://example.com", limit=2)
+        assert result == ["https://example.com/pricing", "https://example.com/tariffs"]
+    
+    def test_find_pricing_priority(self):
+        """Ссылки с более точным ключевым словом идут первыми"""
+        html = '''
+        <html>
+            <body>
+                <a href="/payment">Оплата</a>
+                <a href="/about-cost">Стоимость</a>
+                <a href="/pricing">Цены</a>
+            </body>
+        </html>
+        '''
+        tree = LexborHTMLParser(html)
+        result = find_pricing_links_in_tree(tree, "https://example.com")
+        assert result == [
+            "https://example.com/pricing",
+            "https://example.com/about-cost",
+            "https://example.com/payment"
+        ]
+        assert find_pricing_link(html, "https://example.com") == "https://example.com/pricing"
+    
+    def test_find_pricing_link_prefers_priority_over_order(self):
+        """Ранняя ссылка с менее точным ключевым словом уступает более точной"""
+        html = '''
+        <html>
+            <body>
+                <a href="/delivery-cost">Стоимость доставки</a>
+                <a href="/blog">Блог</a>
+                <a href="/prices">Цены</a>
+            </body>
+        </html>
+        '''
+        assert find_pricing_link(html, "https://example.com") == "https://example.com/prices"
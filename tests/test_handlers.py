@@ -0,0 +1,175 @@
+# Тесты для обработчиков Telegram
+
+import asyncio
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from telegram.ext import ConversationHandler
+from app.telegram import texts
+from app.telegram.handlers import (
+    extract_sheet_id, sheet_url_message_handler, button_callback_handler, WAITING_FOR_URL
+)
+
+
+class TestExtractSheetId:
+    """Тесты для функции extract_sheet_id"""
+
+    def test_spreadsheet_url(self):
+        """ID берется из пути /spreadsheets/d/<id>"""
+        url = "https://docs.google.com/spreadsheets/d/1AbC-d_E2/edit#gid=0"
+        assert extract_sheet_id(url) == "1AbC-d_E2"
+
+    def test_id_query_parameter(self):
+        """ID берется из параметра id=..."""
+        assert extract_sheet_id("https://drive.google.com/open?id=1XyZ_9") == "1XyZ_9"
+        assert extract_sheet_id("https://drive.google.com/open?usp=sharing&id=abc") == "abc"
+
+    def test_gid_is_not_sheet_id(self):
+        """Параметр gid не принимается за ID таблицы"""
+        assert extract_sheet_id("https://example.com/?gid=123") == ""
+
+    def test_invalid_url(self):
+        """Для ссылки без ID возвращается пустая строка"""
+        assert extract_sheet_id("https://example.com") == ""
+        assert extract_sheet_id("") == ""
+
+
+class TestSheetUrlMessageHandler:
+    """Тесты для подключения таблицы"""
+
+    @pytest.mark.asyncio
+    async def test_reply_before_flush(self):
+        """Ответ отправляется сразу, перенос результатов идет в фоне"""
+        update = Mock()
+        update.effective_user.id = 42
+        update.effective_chat.id = 100
+        update.message.text = "https://docs.google.com/spreadsheets/d/sheet_123/edit"
+        update.message.reply_text = AsyncMock()
+
+        context = Mock()
+        context.bot.send_message = AsyncMock()
+        tasks = []
+        context.application.create_task = lambda coro: tasks.append(asyncio.ensure_future(coro))
+
+        with patch('app.telegram.handlers.set_user_sheet_id', new_callable=AsyncMock) as mock_set, \
+             patch('app.telegram.handlers.flush_pending_to_user_sheet', new_callable=AsyncMock) as mock_flush:
+            mock_flush.return_value = 3
+
+            state = await sheet_url_message_handler(update, context)
+
+            assert state == ConversationHandler.END
+            mock_set.assert_awaited_once_with("42", "sheet_123")
+            update.message.reply_text.assert_awaited_once()
+
+            # Итог переноса приходит отдельным сообщением
+            await asyncio.gather(*tasks)
+            mock_flush.assert_awaited_once_with("42")
+            args, _ = context.bot.send_message.await_args
+            assert args[0] == 100
+            assert "3" in args[1]
+
+    @pytest.mark.asyncio
+    async def test_repeated_connect_does_not_duplicate_rows(self):
+        """Два подключения подряд не переносят одни и те же результаты дважды"""
+        update = Mock()
+        update.effective_user.id = 42
+        update.effective_chat.id = 100
+        update.message.text = "https://docs.google.com/spreadsheets/d/sheet_123/edit"
+        update.message.reply_text = AsyncMock()
+
+        context = Mock()
+        context.bot.send_message = AsyncMock()
+        tasks = []
+        context.application.create_task = lambda coro: tasks.append(asyncio.ensure_future(coro))
+
+        # Имитация БД: пачка отмечается перенесенной только после записи в таблицу
+        pending = {1: {"id": 1, "url": "https://site1.com", "result_json": "{}"}}
+
+        async def batches(user_id):
+            if pending:
+                yield list(pending.values())
+
+        async def write_rows(sheet_id, rows):
+            await asyncio.sleep(0.01)
+
+        async def mark_written_many(ids):
+            for result_id in ids:
+                pending.pop(result_id, None)
+
+        with patch('app.telegram.handlers.set_user_sheet_id', new_callable=AsyncMock), \
+             patch('app.features.audit.services.persist.get_user_sheet_id', new_callable=AsyncMock) as mock_get, \
+             patch('app.features.audit.services.persist.iter_unwritten_results', side_effect=batches), \
+             patch('app.features.audit.services.persist.ensure_headers', new_callable=AsyncMock), \
+             patch('app.features.audit.services.persist.write_rows', side_effect=write_rows) as mock_write, \
+             patch('app.features.audit.services.persist.mark_written_many', side_effect=mark_written_many):
+            mock_get.return_value = "sheet_123"
+
+            await sheet_url_message_handler(update, context)
+            await sheet_url_message_handler(update, context)
+            await asyncio.gather(*tasks)
+
+        assert mock_write.call_count == 1
+        messages = [call.args[1] for call in context.bot.send_message.await_args_list]
+        assert sorted(texts.CONNECTED_AND_FLUSHED.format(count=n) for n in (0, 1)) == sorted(messages)
+
+
+def make_callback_update(data: str) -> Mock:
+    """Обновление с нажатием inline кнопки"""
+    update = Mock()
+    update.callback_query.data = data
+    update.callback_query.from_user.id = 42
+    update.callback_query.answer = AsyncMock()
+    update.callback_query.edit_message_text = AsyncMock()
+    return update
+
+
+class TestButtonCallbackHandler:
+    """Тесты для обработчика inline кнопок"""
+
+    @pytest.mark.asyncio
+    async def test_known_callback_answered(self):
+        """Известная кнопка подтверждается и переводит в нужное состояние"""
+        update = make_callback_update("new_analysis")
+
+        state = await button_callback_handler(update, Mock())
+
+        assert state == WAITING_FOR_URL
+        update.callback_query.answer.assert_awaited_once()
+        update.callback_query.edit_message_text.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_unknown_callback_not_answered(self):
+        """На неизвестную кнопку запросы к Telegram не отправляются"""
+        update = make_callback_update("outdated_button")
+
+        state = await button_callback_handler(update, Mock())
+
+        assert state == ConversationHandler.END
+        update.callback_query.answer.assert_not_awaited()
+        update.callback_query.edit_message_text.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_open_sheet_error(self):
+        """Ошибка в действии кнопки показывает сообщение об ошибке"""
+        update = make_callback_update("open_sheet")
+
+        with patch('app.telegram.handlers.get_user_sheet_id', new_callable=AsyncMock) as mock_get:
+            mock_get.side_effect = RuntimeError("db")
+            state = await button_callback_handler(update, Mock())
+
+        assert state == ConversationHandler.END
+        args, _ = update.callback_query.edit_message_text.await_args
+        assert args[0] == texts.ERROR_GENERIC
+
+    @pytest.mark.asyncio
+    async def test_open_sheet_plain_link(self):
+        """Ссылка на таблицу отправляется без разметки и без превью"""
+        update = make_callback_update("open_sheet")
+
+        with patch('app.telegram.handlers.get_user_sheet_id', new_callable=AsyncMock) as mock_get:
+            mock_get.return_value = "sheet_123"
+            await button_callback_handler(update, Mock())
+
+        args, kwargs = update.callback_query.edit_message_text.await_args
+        assert args[0].endswith("/spreadsheets/d/sheet_123")
+        assert "parse_mode" not in kwargs
+        assert kwargs["disable_web_page_preview"] is True
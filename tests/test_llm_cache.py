@@ -0,0 +1,113 @@
+# Тесты для кэша результатов анализа
+
+import os
+import tempfile
+import pytest
+from pathlib import Path
+from app.features.audit.adapters import llm_cache
+from app.features.audit.adapters.llm_cache import (
+    make_cache_key, get_cached_analysis, set_cached_analysis, clear_llm_cache,
+    load_cached_analysis, store_cached_analysis
+)
+from app.storage.sqlite import db, purge_llm_cache
+from app.features.audit.schemas.models import FullResult
+
+
+class TestLLMCache:
+    """Тесты для кэша анализа по хэшу контента"""
+
+    @pytest.fixture(autouse=True)
+    def clean_cache(self):
+        """Каждый тест начинается с пустого кэша"""
+        clear_llm_cache()
+        yield
+        clear_llm_cache()
+
+    def test_key_depends_on_all_parts(self):
+        """Ключ зависит от текста главной, цен и URL цен"""
+        key = make_cache_key("главная", "цены", "https://example.com/prices")
+        assert key == make_cache_key("главная", "цены", "https://example.com/prices")
+        assert key != make_cache_key("главная", "цены", None)
+        assert key != make_cache_key("главнаяцены", None, "https://example.com/prices")
+
+    def test_hit_returns_copy(self):
+        """Повторное чтение возвращает копию сохраненного результата"""
+        key = make_cache_key("главная")
+        set_cached_analysis(key, FullResult(offer_first_screen="Оффер"), ["Пункт"])
+
+        full_result, summary = get_cached_analysis(key)
+        assert full_result.offer_first_screen == "Оффер"
+        assert summary == ["Пункт"]
+
+        # Изменение копии не затрагивает кэш
+        summary.append("Лишний")
+        full_result.offer_first_screen = "Другой"
+        full_result, summary = get_cached_analysis(key)
+        assert full_result.offer_first_screen == "Оффер"
+        assert summary == ["Пункт"]
+
+    def test_expired_entry_is_miss(self, monkeypatch):
+        """Устаревшая запись не возвращается"""
+        monkeypatch.setattr(llm_cache, "LLM_CACHE_TTL", -1)
+        key = make_cache_key("главная")
+        set_cached_analysis(key, FullResult(), [])
+        assert get_cached_analysis(key) is None
+
+    def test_oldest_entry_evicted(self, monkeypatch):
+        """При переполнении вытесняется самая старая запись"""
+        monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_SIZE", 2)
+        keys = [make_cache_key(f"страница {i}") for i in range(3)]
+        for key in keys:
+            set_cached_analysis(key, FullResult(), [])
+
+        assert get_cached_analysis(keys[0]) is None
+        assert get_cached_analysis(keys[1]) is not None
+        assert get_cached_analysis(keys[2]) is not None
+
+
+class TestPersistentLLMCache:
+    """Тесты для сохранения результатов анализа в SQLite"""
+
+    @pytest.fixture(autouse=True)
+    def temp_db(self):
+        """Временная база данных и пустой кэш в памяти"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as f:
+            temp_path = f.name
+
+        original_path = db.db_path
+        db.db_path = Path(temp_path)
+        db._init_db()
+        clear_llm_cache()
+
+        yield db
+
+        clear_llm_cache()
+        db.db_path = original_path
+        os.unlink(temp_path)
+
+    @pytest.mark.asyncio
+    async def test_result_survives_memory_clear(self):
+        """После очистки памяти (перезапуска) результат читается из БД"""
+        key = make_cache_key("главная", "цены")
+        await store_cached_analysis(key, FullResult(offer_first_screen="Оффер"), ["Пункт"])
+
+        clear_llm_cache()
+        full_result, summary = await load_cached_analysis(key)
+        assert full_result.offer_first_screen == "Оффер"
+        assert summary == ["Пункт"]
+
+        # Результат из БД снова попадает в память
+        assert get_cached_analysis(key) is not None
+
+    @pytest.mark.asyncio
+    async def test_expired_result_is_miss(self, monkeypatch):
+        """Устаревший результат в БД не возвращается и удаляется очисткой"""
+        key = make_cache_key("главная")
+        await store_cached_analysis(key, FullResult(), [])
+        clear_llm_cache()
+
+        monkeypatch.setattr(llm_cache, "LLM_CACHE_TTL", -1)
+        assert await load_cached_analysis(key) is None
+
+        await purge_llm_cache(-1)
+        assert db.execute_query("SELECT * FROM llm_cache") == []
@@ -0,0 +1,84 @@
+# Тесты для разбора ответов модели
+
+import asyncio
+import orjson
+import pytest
+from unittest.mock import Mock
+from app.features.audit.adapters.llm import (
+    clean_json_response, parse_short_summary, truncate_text, _execute_tool_call
+)
+
+
+class TestCleanJsonResponse:
+    """Тесты для функции clean_json_response"""
+
+    def test_markdown_wrapper_removed(self):
+        """Обертка ```json ... ``` должна удаляться"""
+        text = '```json\n{"a": "b"}\n```'
+        assert clean_json_response(text) == '{"a": "b"}'
+
+    def test_text_around_json(self):
+        """Текст до и после JSON объекта отбрасывается"""
+        text = 'Вот результат: {"a": {"b": 1}} Надеюсь, помог'
+        assert clean_json_response(text) == '{"a": {"b": 1}}'
+
+    def test_no_json(self):
+        """Без фигурных скобок возвращается очищенный текст"""
+        assert clean_json_response("  нет данных  ") == "нет данных"
+
+
+class TestParseShortSummary:
+    """Тесты для функции parse_short_summary"""
+
+    def test_bullet_markers(self):
+        """Поддерживаются маркеры -, • и *"""
+        text = "- Первый\n• Второй\n* Третий\nбез маркера\n\n-"
+        assert parse_short_summary(text) == ["Первый", "Второй", "Третий"]
+
+    def test_fallback_to_sentences(self):
+        """Без маркеров текст разбивается по точкам"""
+        assert parse_short_summary("Первый. Второй.") == ["Первый", "Второй"]
+
+    def test_limit_four_points(self):
+        """Возвращается не больше 4 пунктов"""
+        text = "\n".join(f"- Пункт {i}" for i in range(6))
+        assert len(parse_short_summary(text)) == 4
+
+    def test_empty(self):
+        """Пустая сводка дает пустой список"""
+        assert parse_short_summary("") == []
+
+
+class TestTruncateText:
+    """Тесты для функции truncate_text"""
+
+    def test_short_text_unchanged(self):
+        """Текст короче лимита возвращается как есть"""
+        assert truncate_text("короткий текст", 100) == "короткий текст"
+        assert truncate_text(None, 100) is None
+
+    def test_cut_on_word_boundary(self):
+        """Обрезка по границе слова, не длиннее лимита"""
+        text = "слово " * 100
+        result = truncate_text(text, 50)
+        assert len(result) <= 50
+        assert result.endswith("слово")
+
+    def test_hard_cut_without_spaces(self):
+        """Без пробелов рядом с лимитом текст режется ровно по лимиту"""
+        assert truncate_text("а" * 100, 40) == "а" * 40
+
+
+class TestExecuteToolCall:
+    """Тесты для выполнения tool calls"""
+
+    @pytest.mark.asyncio
+    async def test_malformed_arguments_return_error(self):
+        """Некорректный JSON аргументов дает ошибку вызова, а не исключение"""
+        tool_call = Mock()
+        tool_call.function.name = "fetch_url"
+        tool_call.function.arguments = '{"url": '
+
+        result = orjson.loads(await _execute_tool_call(tool_call, asyncio.Semaphore(1)))
+
+        assert "fetch_url" in result["error"]
@@ -1,6 +1,8 @@
+import json
 import pytest
 from datetime import datetime
 from app.features.audit.schemas.models import FullResult, RowForSheet
+from app.features.audit.services.persist import convert_json_to_row
 
 
 class TestPydanticModels:
@@ -136,4 +138,28 @@ class TestPydanticModels:
         # 7+ пунктов - нормально
         many_pains = "\n".join([f"Боль {i}" for i in range(1, 8)])
         result = FullResult(target_audience_pains=many_pains)
-        assert result.target_audience_pains == many_pains
\ No newline at end of file
+        assert result.target_audience_pains == many_pains
+    
+    def test_convert_json_to_row_matches_row_for_sheet(self):
+        """Строка из convert_json_to_row совпадает с RowForSheet.to_sheet_row"""
+        full_result = FullResult(
+            offer_first_screen="Тестовый оффер",
+            faq="Вопрос?",
+            notes="Заметка"
+        )
+        result_json = json.dumps({
+            "full_result": full_result.model_dump(),
+            "pricing_url": "https://example.com/prices"
+        })
+        
+        row = convert_json_to_row(result_json, "test_user", "https://example.com")
+        expected = RowForSheet.from_full_result(
+            result=full_result,
+            user_id="test_user",
+            analyzed_url="https://example.com",
+            pricing_url="https://example.com/prices"
+        ).to_sheet_row()
+        
+        assert len(row) == 28
+        assert row[0] != ""  # timestamp заполнен
+        assert row[1:] == expected[1:]
@@ -0,0 +1,61 @@
+# Тесты для ограничения частоты запросов к Telegram
+
+import time
+import pytest
+from unittest.mock import AsyncMock
+from telegram.error import RetryAfter
+from app.telegram.rate_limiter import TokenBucketRateLimiter
+
+
+async def call(limiter: TokenBucketRateLimiter, callback, chat_id=1):
+    """Запрос через ограничитель как из PTB"""
+    data = {"chat_id": chat_id} if chat_id is not None else {}
+    return await limiter.process_request(callback, (), {}, "sendMessage", data, None)
+
+
+class TestTokenBucketRateLimiter:
+    """Тесты для TokenBucketRateLimiter"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_throttle(self):
+        """После исчерпания запаса запросы ждут пополнения токенов"""
+        limiter = TokenBucketRateLimiter(rate=50, burst=2)
+        callback = AsyncMock(return_value=True)
+
+        started = time.monotonic()
+        for _ in range(4):
+            assert await call(limiter, callback) is True
+        elapsed = time.monotonic() - started
+
+        # 2 запроса из запаса и 2 по 1/50 с
+        assert callback.await_count == 4
+        assert elapsed >= 0.03
+
+    @pytest.mark.asyncio
+    async def test_requests_without_chat_not_limited(self):
+        """Запросы без chat_id не расходуют токены"""
+        limiter = TokenBucketRateLimiter(rate=1, burst=1)
+        callback = AsyncMock(return_value=True)
+
+        started = time.monotonic()
+        for _ in range(3):
+            await call(limiter, callback, chat_id=None)
+        assert time.monotonic() - started < 0.5
+
+    @pytest.mark.asyncio
+    async def test_retry_after(self):
+        """После RetryAfter запрос повторяется"""
+        limiter = TokenBucketRateLimiter()
+        callback = AsyncMock(side_effect=[RetryAfter(0), {"ok": True}])
+
+        assert await call(limiter, callback) == {"ok": True}
+        assert callback.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_retry_after_exhausted(self):
+        """Если лимит повторов исчерпан, RetryAfter передается дальше"""
+        limiter = TokenBucketRateLimiter(max_retries=0)
+        callback = AsyncMock(side_effect=RetryAfter(0))
+
+        with pytest.raises(RetryAfter):
+            await call(limiter, callback)
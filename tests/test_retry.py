@@ -0,0 +1,94 @@
+import pytest
+from unittest.mock import patch
+
+import app.core.retry as retry_module
+from app.core.retry import retry_on_network_error, retry_on_api_error
+
+
+class TestRetry:
+    """Тесты для декораторов повторных попыток"""
+    
+    @pytest.fixture(autouse=True)
+    def no_delay(self):
+        """Убираем паузу между попытками"""
+        with patch.object(retry_module, 'RETRY_DELAY', 0):
+            yield
+    
+    @pytest.mark.asyncio
+    async def test_async_function_is_retried(self):
+        """Async функция повторяется после сетевой ошибки"""
+        calls = []
+        
+        @retry_on_network_error
+        async def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ConnectionError("Временная ошибка")
+            return "ok"
+        
+        assert await flaky() == "ok"
+        assert len(calls) == 2
+    
+    @pytest.mark.asyncio
+    async def test_async_function_gives_up_after_max_attempts(self):
+        """После исчерпания попыток пробрасывается исходная ошибка"""
+        calls = []
+        
+        @retry_on_network_error
+        async def broken():
+            calls.append(1)
+            raise ConnectionError("Постоянная ошибка")
+        
+        with pytest.raises(ConnectionError):
+            await broken()
+        assert len(calls) == retry_module.RETRY_ATTEMPTS
+    
+    @pytest.mark.asyncio
+    async def test_non_network_error_not_retried(self):
+        """Не сетевые ошибки не повторяются"""
+        calls = []
+        
+        @retry_on_network_error
+        async def bad_value():
+            calls.append(1)
+            raise ValueError("Некорректные данные")
+        
+        with pytest.raises(ValueError):
+            await bad_value()
+        assert len(calls) == 1
+    
+    def test_sync_function_is_retried(self):
+        """Синхронная функция тоже повторяется"""
+        calls = []
+        
+        @retry_on_api_error
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise TimeoutError("Таймаут")
+            return 42
+        
+        assert flaky() == 42
+        assert len(calls) == 2
+    
+    def test_api_error_logs_traceback_before_retry(self):
+        """retry_on_api_error пишет traceback первой ошибки перед повтором"""
+        records = []
+        handler_id = retry_module.logger.add(records.append, level="WARNING", format="{message}")
+        calls = []
+        
+        @retry_on_api_error
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise TimeoutError("Таймаут")
+            return 42
+        
+        try:
+            assert flaky() == 42
+        finally:
+            retry_module.logger.remove(handler_id)
+        
+        warnings = [r for r in records if r.record["level"].name == "WARNING"]
+        assert len(warnings) == 1
+        assert warnings[0].record["exception"] is not None
@@ -0,0 +1,61 @@
+# Тесты для работы с Google Sheets
+
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+from app.features.audit.adapters import sheets
+
+
+class TestEnsureHeaders:
+    """Тесты для функции ensure_headers"""
+    
+    @pytest.fixture(autouse=True)
+    def clean_cache(self):
+        """Каждый тест начинается без проверенных таблиц"""
+        sheets._headered_sheets.clear()
+        sheets._headers_locks.clear()
+        yield
+        sheets._headered_sheets.clear()
+        sheets._headers_locks.clear()
+    
+    @pytest.mark.asyncio
+    async def test_headers_checked_once_per_sheet(self):
+        """Повторный вызов для той же таблицы не обращается к API"""
+        with patch.object(sheets, '_ensure_headers_sync') as mock_sync:
+            await sheets.ensure_headers("sheet_1")
+            await sheets.ensure_headers("sheet_1")
+            await sheets.ensure_headers("sheet_2")
+        
+        assert [call.args[0] for call in mock_sync.call_args_list] == ["sheet_1", "sheet_2"]
+    
+    @pytest.mark.asyncio
+    async def test_slow_sheet_does_not_block_other_sheets(self):
+        """Медленная проверка одной таблицы не задерживает другие"""
+        release = threading.Event()
+        
+        def slow_sync(sheet_id):
+            if sheet_id == "slow_sheet":
+                release.wait(5)
+        
+        with patch.object(sheets, '_ensure_headers_sync', side_effect=slow_sync):
+            slow = asyncio.create_task(sheets.ensure_headers("slow_sheet"))
+            await asyncio.sleep(0.01)
+            
+            await asyncio.wait_for(sheets.ensure_headers("fast_sheet"), timeout=1)
+            assert not slow.done()
+            
+            release.set()
+            await slow
+        
+        assert sheets._headers_locks == {}
+    
+    @pytest.mark.asyncio
+    async def test_failed_check_not_cached(self, monkeypatch):
+        """После ошибки таблица проверяется снова"""
+        monkeypatch.setattr("app.core.retry.RETRY_DELAY", 0)
+        with patch.object(sheets, '_ensure_headers_sync', side_effect=RuntimeError("нет доступа")):
+            with pytest.raises(RuntimeError):
+                await sheets.ensure_headers("sheet_1")
+        
+        assert "sheet_1" not in sheets._headered_sheets
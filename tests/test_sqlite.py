@@ -6,7 +6,8 @@ from pathlib import Path
 from app.storage.sqlite import (
     Database, get_user_sheet_id, set_user_sheet_id,
     ensure_user_limit, can_run, increment_counter, set_limit,
-    save_pending_result, fetch_unwritten_results, mark_written
+    save_pending_result, fetch_unwritten_results, mark_written, mark_written_many,
+    iter_unwritten_results, begin_audit, release_audit, clear_sheet_cache
 )
 
 
@@ -29,11 +30,13 @@ class TestSQLiteDatabase:
         
         # Пересоздаем БД с новым путем
         db._init_db()
+        clear_sheet_cache()
         
         yield db
         
         # Восстанавливаем оригинальный путь
         db.db_path = original_path
+        clear_sheet_cache()
         try:
             os.unlink(temp_path)
         except:
@@ -63,6 +66,28 @@ class TestSQLiteDatabase:
         result = await get_user_sheet_id(user_id)
         assert result == new_sheet_id
     
+    @pytest.mark.asyncio
+    async def test_user_sheet_id_cache(self, temp_db):
+        """sheet_id читается из кэша, set_user_sheet_id обновляет кэш"""
+        user_id = "test_cached_user"
+        
+        assert await get_user_sheet_id(user_id) is None
+        
+        # Запись в обход set_user_sheet_id не видна, пока жива запись кэша
+        temp_db.execute_update(
+            "INSERT INTO users_settings (user_id, sheet_id) VALUES (?, ?)",
+            (user_id, "direct_sheet")
+        )
+        assert await get_user_sheet_id(user_id) is None
+        
+        # set_user_sheet_id сразу обновляет кэш
+        await set_user_sheet_id(user_id, "new_sheet")
+        assert await get_user_sheet_id(user_id) == "new_sheet"
+        
+        # После очистки кэша значение читается из БД
+        clear_sheet_cache()
+        assert await get_user_sheet_id(user_id) == "new_sheet"
+    
     @pytest.mark.asyncio
     async def test_user_limits_operations(self, temp_db):
         """Тестирование лимитов пользователей"""
@@ -95,6 +120,25 @@ class TestSQLiteDatabase:
         can_execute = await can_run(user_id, default_limit)
         assert can_execute is True  # Снова можем выполнять
     
+    @pytest.mark.asyncio
+    async def test_begin_audit(self, temp_db):
+        """Проверка лимита, резервирование и получение sheet_id одним запросом"""
+        user_id = "test_begin_audit"
+        
+        # Новый пользователь: лимит создается, таблицы нет
+        assert await begin_audit(user_id, 2) == (True, None)
+        
+        # Второй анализ занимает последний слот
+        await set_user_sheet_id(user_id, "sheet_123")
+        assert await begin_audit(user_id, 2) == (True, "sheet_123")
+        
+        # Лимит исчерпан, запись лимита не пересоздается
+        assert await begin_audit(user_id, 5) == (False, "sheet_123")
+        
+        # Возврат резерва освобождает слот
+        await release_audit(user_id)
+        assert await can_run(user_id, 2) is True
+    
     @pytest.mark.asyncio
     async def test_pending_results_operations(self, temp_db):
         """Тестирование отложенных результатов"""
@@ -153,6 +197,117 @@ class TestSQLiteDatabase:
         assert urls[2] in remaining_urls
         assert urls[0] not in remaining_urls
     
+    @pytest.mark.asyncio
+    async def test_legacy_text_created_at_migrated(self, temp_db):
+        """Старая таблица с created_at TEXT переводится на Unix-время один раз"""
+        # Схема до миграции: created_at объявлен как TEXT
+        temp_db.execute_update("DROP TABLE pending_results")
+        temp_db.execute_update("""
+            CREATE TABLE pending_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                result_json TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                written INTEGER DEFAULT 0
+            )
+        """)
+        temp_db.execute_update(
+            "INSERT INTO pending_results (user_id, url, result_json, created_at) VALUES (?, ?, ?, ?)",
+            ("legacy_user", "https://old.com", "{}", "2025-01-01T12:00:00.123456")
+        )
+        # Строка, уже переведенная прежней миграцией в число-строку
+        temp_db.execute_update(
+            "INSERT INTO pending_results (user_id, url, result_json, created_at) VALUES (?, ?, ?, ?)",
+            ("legacy_user", "https://mid.com", "{}", "1735740000")
+        )
+        
+        # Повторный запуск не должен портить уже переведенные значения
+        temp_db._init_db()
+        temp_db._init_db()
+        
+        new_id = await save_pending_result("legacy_user", "https://new.com", "{}")
+        
+        results = await fetch_unwritten_results("legacy_user")
+        assert all(isinstance(r['created_at'], int) for r in results)
+        assert all(r['created_at'] > 1_700_000_000 for r in results)
+        assert [r['url'] for r in results] == ["https://old.com", "https://mid.com", "https://new.com"]
+        assert results[2]['id'] == new_id
+    
+    def test_execute_insert_and_update_results(self, temp_db):
+        """execute_insert возвращает rowid, execute_update - число измененных строк"""
+        first_id = temp_db.execute_insert(
+            "INSERT INTO pending_results (user_id, url, result_json, created_at) VALUES (?, ?, ?, ?)",
+            ("rowcount_user", "https://a.com", "{}", 1)
+        )
+        second_id = temp_db.execute_insert(
+            "INSERT INTO pending_results (user_id, url, result_json, created_at) VALUES (?, ?, ?, ?)",
+            ("rowcount_user", "https://b.com", "{}", 2)
+        )
+        assert second_id == first_id + 1
+        
+        # После INSERT на том же соединении возвращается rowcount, а не старый rowid
+        assert temp_db.execute_update(
+            "UPDATE pending_results SET written = 1 WHERE user_id = ?", ("rowcount_user",)
+        ) == 2
+        assert temp_db.execute_update(
+            "DELETE FROM pending_results WHERE user_id = ?", ("missing_user",)
+        ) == 0
+    
+    @pytest.mark.asyncio
+    async def test_mark_written_many(self, temp_db):
+        """Пакетная отметка результатов как перенесенных"""
+        user_id = "test_bulk_user"
+        
+        result_ids = []
+        for i in range(3):
+            result_ids.append(await save_pending_result(user_id, f"https://site{i}.com", "{}"))
+        
+        # Отмечаем первые два одним запросом
+        await mark_written_many(result_ids[:2])
+        
+        results = await fetch_unwritten_results(user_id)
+        assert [r['id'] for r in results] == [result_ids[2]]
+        
+        # Пустой список ничего не делает
+        await mark_written_many([])
+        assert len(await fetch_unwritten_results(user_id)) == 1
+    
+    @pytest.mark.asyncio
+    async def test_iter_unwritten_results_batches(self, temp_db):
+        """Потоковое чтение отложенных результатов пачками"""
+        user_id = "test_batch_user"
+        
+        result_ids = []
+        for i in range(5):
+            result_ids.append(await save_pending_result(user_id, f"https://site{i}.com", "{}"))
+        await save_pending_result("other_user", "https://other.com", "{}")
+        
+        # Отмечаем каждую пачку сразу после чтения, как при переносе в таблицу
+        batches = []
+        async for batch in iter_unwritten_results(user_id, batch_size=2):
+            batches.append([r['id'] for r in batch])
+            await mark_written_many(batches[-1])
+        
+        assert batches == [result_ids[0:2], result_ids[2:4], result_ids[4:5]]
+        assert await fetch_unwritten_results(user_id) == []
+
+    @pytest.mark.asyncio
+    async def test_concurrent_reads_and_writes(self, temp_db):
+        """Параллельные чтения видят данные, записанные через общее соединение"""
+        user_id = "test_concurrent_user"
+
+        await asyncio.gather(*[
+            save_pending_result(user_id, f"https://site{i}.com", "{}") for i in range(10)
+        ])
+        results = await asyncio.gather(*[fetch_unwritten_results(user_id) for _ in range(10)])
+        assert all(len(r) == 10 for r in results)
+
+        # Соединения для чтения не допускают запись
+        import sqlite3
+        with pytest.raises(sqlite3.OperationalError):
+            temp_db.execute_query("DELETE FROM pending_results")
+
     @pytest.mark.asyncio
     async def test_different_users_isolation(self, temp_db):
         """Тестирование изоляции данных разных пользователей"""
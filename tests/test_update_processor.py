@@ -0,0 +1,94 @@
+# Тесты для обработки обновлений по чатам
+
+import asyncio
+import pytest
+from unittest.mock import Mock
+from telegram import Update
+from app.telegram.update_processor import PerChatUpdateProcessor
+
+
+def make_update(chat_id: int) -> Mock:
+    """Обновление из указанного чата"""
+    update = Mock(spec=Update)
+    update.effective_chat.id = chat_id
+    return update
+
+
+class TestPerChatUpdateProcessor:
+    """Тесты для PerChatUpdateProcessor"""
+
+    @pytest.mark.asyncio
+    async def test_same_chat_sequential_other_chats_concurrent(self):
+        """Обновления одного чата идут по очереди, разных чатов - параллельно"""
+        processor = PerChatUpdateProcessor(max_concurrent_updates=10)
+        events = []
+
+        async def handler(name: str):
+            events.append(f"start {name}")
+            await asyncio.sleep(0.01)
+            events.append(f"end {name}")
+
+        await asyncio.gather(
+            processor.do_process_update(make_update(1), handler("a1")),
+            processor.do_process_update(make_update(1), handler("a2")),
+            processor.do_process_update(make_update(2), handler("b1")),
+        )
+
+        # Второе обновление чата 1 начинается только после первого
+        assert events.index("start a2") > events.index("end a1")
+        # Чат 2 не ждет чат 1
+        assert events.index("start b1") < events.index("end a1")
+
+    @pytest.mark.asyncio
+    async def test_queued_updates_do_not_block_other_chats(self):
+        """Обновления в очереди одного чата не занимают слоты других чатов"""
+        processor = PerChatUpdateProcessor(max_concurrent_updates=2)
+        release_a = asyncio.Event()
+        done = []
+
+        async def slow(name: str):
+            await release_a.wait()
+            done.append(name)
+
+        async def fast(name: str):
+            done.append(name)
+
+        # Два обновления чата A: первое висит, второе ждет в очереди чата
+        a1 = asyncio.create_task(processor.process_update(make_update(1), slow("a1")))
+        a2 = asyncio.create_task(processor.process_update(make_update(1), slow("a2")))
+        await asyncio.sleep(0)
+
+        # Чат B обрабатывается, пока чат A заблокирован
+        await asyncio.wait_for(processor.process_update(make_update(2), fast("b1")), timeout=1)
+        assert done == ["b1"]
+
+        release_a.set()
+        await asyncio.gather(a1, a2)
+        assert done == ["b1", "a1", "a2"]
+
+    @pytest.mark.asyncio
+    async def test_chat_locks_released(self):
+        """После обработки блокировки чатов не накапливаются"""
+        processor = PerChatUpdateProcessor()
+
+        async def failing():
+            raise RuntimeError("ошибка обработчика")
+
+        await processor.do_process_update(make_update(1), asyncio.sleep(0))
+        with pytest.raises(RuntimeError):
+            await processor.do_process_update(make_update(2), failing())
+
+        assert processor._chat_locks == {}
+        assert processor._chat_users == {}
+
+    @pytest.mark.asyncio
+    async def test_update_without_chat(self):
+        """Обновление без чата обрабатывается сразу"""
+        processor = PerChatUpdateProcessor()
+        done = []
+
+        async def handler():
+            done.append(True)
+
+        await processor.do_process_update(object(), handler())
+        assert done == [True]
@@ -1,5 +1,5 @@
 import pytest
-from app.core.utils import normalize_url
+from app.core.utils import normalize_url, is_valid_url, extract_domain
 
 
 class TestUrlNormalize:
@@ -64,4 +64,21 @@ class TestUrlNormalize:
         """Домены должны быть в нижнем регистре"""
         assert normalize_url("SITE.COM") == "https://site.com"
         assert normalize_url("Example.ORG") == "https://example.org"
-        assert normalize_url("https://WWW.GOOGLE.COM") == "https://google.com"
\ No newline at end of file
+        assert normalize_url("https://WWW.GOOGLE.COM") == "https://google.com"
+    
+    def test_canonical_url_unchanged(self):
+        """Уже нормализованный URL возвращается как есть"""
+        assert normalize_url("https://site.com/page?id=1#top") == "https://site.com/page?id=1#top"
+        assert normalize_url("https://site.com/catalog/") == "https://site.com/catalog/"
+    
+    def test_fragment_and_empty_parts(self):
+        """Fragment сохраняется, пустые query/fragment отбрасываются"""
+        assert normalize_url("site.com/page#section") == "https://site.com/page#section"
+        assert normalize_url("https://site.com/page?") == "https://site.com/page"
+        assert normalize_url("https://site.com#") == "https://site.com"
+    
+    def test_unhashable_input(self):
+        """Нехэшируемый аргумент не ломает кэш, а дает пустой результат"""
+        assert normalize_url(["site.com"]) == ""
+        assert is_valid_url({"url": "https://site.com"}) is False
+        assert extract_domain(["https://site.com"]) == ""